@@ -1,4 +1,5 @@
 import hashlib
+from profiling import profiled
 
 def sha256_stream_cipher_encrypt(secret_bytes, key_k):
     ciphertext = bytearray()
@@ -12,8 +13,11 @@ def sha256_stream_cipher_encrypt(secret_bytes, key_k):
         counter += 1
     return bytes(ciphertext)
 
-if __name__ == "__main__":
+def main():
     secret = input("Input secret: ")
     key = input("Input key: ")
 
     print(sha256_stream_cipher_encrypt(secret.encode(), key.encode()).hex())
+
+if __name__ == "__main__":
+    profiled(main)
@@ -0,0 +1,90 @@
+import argparse
+import hashlib
+import os
+from encrypt import sha256_stream_cipher_encrypt
+from profiling import profiled
+
+# The content is encrypted once under a random content key (CK). Each buyer
+# gets their own K, committed to as hashk = SHA256(K) in the asm.py script,
+# and a 32 byte blob = CK encrypted under K. Adding a buyer only wraps CK,
+# whatever the size of the content. Revealing K on-chain unlocks the blob only.
+
+CONTENT_KEY_SIZE = 32
+
+def seal(content, content_key=None):
+    """Encrypt the content once, returning (content key, ciphertext)."""
+    content_key = content_key or os.urandom(CONTENT_KEY_SIZE)
+    return content_key, sha256_stream_cipher_encrypt(content, content_key)
+
+def content_key_commitment(content_key):
+    """Published next to the ciphertext so buyers can check an unwrapped key."""
+    return hashlib.sha256(b"zkcp-content-key" + content_key).digest()
+
+def wrap_key(content_key, key_k):
+    """Per-buyer blob: the content key encrypted under that buyer's K."""
+    return sha256_stream_cipher_encrypt(content_key, key_k)
+
+def unwrap_key(blob, key_k, commitment=None):
+    """Recover the content key with the K revealed on-chain."""
+    content_key = sha256_stream_cipher_encrypt(blob, key_k)
+    if commitment is not None and content_key_commitment(content_key) != commitment:
+        raise ValueError("K does not unwrap this blob to the committed content key")
+    return content_key
+
+def add_buyer(content_key, key_k=None):
+    """Wrap the content key for a new buyer, returning (K, hashk, blob)."""
+    key_k = key_k or os.urandom(32).hex().encode()
+    return key_k, hashlib.sha256(key_k).digest(), wrap_key(content_key, key_k)
+
+def open_envelope(ciphertext, blob, key_k, commitment=None):
+    """Decrypt the shared ciphertext with a buyer's blob and revealed K."""
+    return sha256_stream_cipher_encrypt(ciphertext, unwrap_key(blob, key_k, commitment))
+
+def main():
+    parser = argparse.ArgumentParser(description="Envelope encryption: one ciphertext, one key blob per buyer")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("seal", help="Encrypt content once under a fresh content key")
+    p.add_argument("content", help="File to encrypt")
+    p.add_argument("ciphertext", help="Where to write the ciphertext")
+
+    p = sub.add_parser("add-buyer", help="Wrap the content key under a buyer's K")
+    p.add_argument("content_key", help="Content key printed by seal (hex)")
+    p.add_argument("--k", help="Key (K) for this buyer (default: random)")
+
+    p = sub.add_parser("open", help="Decrypt with a key blob and the K revealed on-chain")
+    p.add_argument("ciphertext", help="Ciphertext written by seal")
+    p.add_argument("blob", help="Buyer's key blob (hex)")
+    p.add_argument("k", help="Key (K)")
+    p.add_argument("output", help="Where to write the content")
+    p.add_argument("--commitment", help="Content key commitment printed by seal (hex)")
+
+    args = parser.parse_args()
+
+    if args.command == "seal":
+        with open(args.content, "rb") as f:
+            content_key, ciphertext = seal(f.read())
+        with open(args.ciphertext, "wb") as f:
+            f.write(ciphertext)
+        print(f"content_key: {content_key.hex()}")
+        print(f"commitment: {content_key_commitment(content_key).hex()}")
+    elif args.command == "add-buyer":
+        key_k, hashk, blob = add_buyer(bytes.fromhex(args.content_key), args.k.encode() if args.k else None)
+        # hashk is what complete/asm.py takes as its first argument
+        print(f"k: {key_k.decode()}")
+        print(f"hashk: {hashk.hex()}")
+        print(f"blob: {blob.hex()}")
+    elif args.command == "open":
+        with open(args.ciphertext, "rb") as f:
+            ciphertext = f.read()
+        try:
+            commitment = bytes.fromhex(args.commitment) if args.commitment else None
+            content = open_envelope(ciphertext, bytes.fromhex(args.blob), args.k.encode(), commitment)
+        except ValueError as e:
+            # Before opening the output, so a wrong K leaves no file behind
+            parser.error(str(e))
+        with open(args.output, "wb") as f:
+            f.write(content)
+
+if __name__ == "__main__":
+    profiled(main)
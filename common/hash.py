@@ -1,5 +1,6 @@
 import argparse
 import hashlib
+from profiling import profiled
 
 def main():
     parser = argparse.ArgumentParser(description="Hash parser")
@@ -12,5 +13,5 @@ def main():
     print(hash_k)
 
 if __name__ == "__main__":
-    main()
+    profiled(main)
 
@@ -0,0 +1,142 @@
+"""
+ZKCP Profiling - cProfile plus a stack sampler that splits CPU time from subprocess/RPC waits
+
+Any entry point wrapped with profiled(main) accepts `--profile` or
+`--profile=PREFIX`, or reads the ZKCP_PROFILE environment variable, and writes:
+
+    PREFIX.pstats     cProfile stats (python -m pstats PREFIX.pstats)
+    PREFIX.collapsed  sampled stacks in microseconds, rooted at "cpu" or "wait", for flamegraph.pl / speedscope
+    PREFIX.json       wall, CPU, subprocess wait and child CPU totals
+
+A bare `--profile` never takes the next argument, so it can go anywhere
+among the script's own arguments.
+"""
+
+import cProfile
+import collections
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+PROFILE_ENV = "ZKCP_PROFILE"
+
+# Frames from these files mean the main thread is blocked on a child process or socket
+WAIT_FILES = {"subprocess.py", "selectors.py", "socket.py", "client.py", "ssl.py"}
+
+def profile_prefix():
+    """Output prefix requested by --profile[=PREFIX] or ZKCP_PROFILE, removing the flag from argv."""
+    default = "profile-" + os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    prefix = None
+    rest = []
+    for arg in sys.argv[1:]:
+        if arg == "--profile":
+            prefix = default
+        elif arg.startswith("--profile="):
+            prefix = arg.partition("=")[2] or default
+        else:
+            rest.append(arg)
+    sys.argv[1:] = rest
+    if prefix is None and os.environ.get(PROFILE_ENV):
+        value = os.environ[PROFILE_ENV]
+        prefix = default if value.lower() in ("1", "true", "yes") else value
+    return prefix
+
+class Profiler:
+    """cProfile of the main thread plus a sampler thread for collapsed stacks.
+
+    The sampler needs the GIL, so it wakes about every switch interval (5 ms)
+    while the main thread computes but every `interval` while it waits on a
+    child process. Each sample is weighted by the time since the previous one
+    so CPU and wait stacks are compared in time rather than in sample counts.
+    """
+
+    def __init__(self, prefix, interval=0.001):
+        self.prefix = prefix
+        self.interval = interval
+        self.profile = cProfile.Profile()
+        self.samples = collections.Counter()  # stack -> seconds
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, daemon=True)
+        self.main_thread = threading.main_thread().ident
+        self.subprocess_calls = 0
+        self.subprocess_wait = 0.0
+        self.original_run = subprocess.run
+
+    def _timed_run(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.original_run(*args, **kwargs)
+        finally:
+            self.subprocess_calls += 1
+            self.subprocess_wait += time.perf_counter() - start
+
+    def _sample(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            frame = sys._current_frames().get(self.main_thread)
+            stack = []
+            waiting = False
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                waiting = waiting or filename in WAIT_FILES
+                stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(["wait" if waiting else "cpu"] + stack[::-1])] += elapsed
+
+    def start(self):
+        subprocess.run = self._timed_run
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.children_start = os.times()
+        self.sampler.start()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.stopped.set()
+        self.sampler.join()
+        subprocess.run = self.original_run
+
+        wall = time.perf_counter() - self.wall_start
+        children = os.times()
+        summary = {
+            "wall_s": round(wall, 6),
+            "cpu_s": round(time.process_time() - self.cpu_start, 6),
+            "subprocess_calls": self.subprocess_calls,
+            "subprocess_wait_s": round(self.subprocess_wait, 6),
+            "children_cpu_s": round(
+                (children.children_user - self.children_start.children_user)
+                + (children.children_system - self.children_start.children_system), 6),
+            "sampled_cpu_s": round(sum((t for stack, t in self.samples.items() if stack.startswith("cpu;")), 0.0), 6),
+            "sampled_wait_s": round(sum((t for stack, t in self.samples.items() if stack.startswith("wait;")), 0.0), 6),
+        }
+
+        self.profile.dump_stats(f"{self.prefix}.pstats")
+        with open(f"{self.prefix}.collapsed", "w") as f:
+            for stack, seconds in self.samples.most_common():
+                f.write(f"{stack} {round(seconds * 1000000)}\n")
+        with open(f"{self.prefix}.json", "w") as f:
+            json.dump(summary, f, indent=2)
+
+        print(f"[*] Profile written to {self.prefix}.pstats, .collapsed and .json: "
+              f"wall {summary['wall_s']:.3f}s, cpu {summary['cpu_s']:.3f}s, "
+              f"subprocess wait {summary['subprocess_wait_s']:.3f}s", file=sys.stderr)
+
+def profiled(main):
+    """Run main(), under the profiler if one was requested."""
+    prefix = profile_prefix()
+    if prefix is None:
+        return main()
+    profiler = Profiler(prefix)
+    profiler.start()
+    try:
+        return main()
+    finally:
+        profiler.stop()
@@ -1,5 +1,7 @@
 import argparse
 import hashlib
+import os
+import sys
 from bitcoin.core import x, CScript
 from bitcoin.core.script import (
     OP_SHA256,
@@ -12,6 +14,23 @@ from bitcoin.core.script import (
     OP_CHECKSIG
 )
 
+def build_redeem_script(hashk, seller_pubkey, locktime, buyer_pubkey):
+    """Redeem script paying the seller on SHA256(K) == hashk, or the buyer after locktime."""
+    return CScript([
+        OP_SHA256,
+        hashk,
+        OP_EQUAL,
+        OP_IF,
+            seller_pubkey,
+        OP_ELSE,
+            locktime,
+            OP_CHECKLOCKTIMEVERIFY,
+            OP_DROP,
+            buyer_pubkey,
+        OP_ENDIF,
+        OP_CHECKSIG
+    ])
+
 def main():
     parser = argparse.ArgumentParser(description="Generate Bitcoin redeem script")
     parser.add_argument("hashk", help="SHA256 hash of encryption key (K)")
@@ -22,23 +41,12 @@ def main():
     args = parser.parse_args()
 
     # Construct script
-    script = CScript([
-        OP_SHA256,
-        x(args.hashk),
-        OP_EQUAL,
-        OP_IF,
-            x(args.seller_pubkey),
-        OP_ELSE,
-            args.locktime,
-            OP_CHECKLOCKTIMEVERIFY,
-            OP_DROP,
-            x(args.buyer_pubkey),
-        OP_ENDIF,
-        OP_CHECKSIG
-    ])
+    script = build_redeem_script(x(args.hashk), x(args.seller_pubkey), args.locktime, x(args.buyer_pubkey))
 
     print(script.hex())
 
 if __name__ == "__main__":
-    main()
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+    from profiling import profiled
+    profiled(main)
 
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+ZKCP End-to-End Runs - Claim, refund and K extraction, each on its own isolated regtest node
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Tuple
+from bitcoin.core import x, CScript, CTransaction
+from bitcoin.wallet import P2SHBitcoinAddress
+from asm import build_redeem_script
+from registry import ContractRegistry, script_hash, STATE_CLAIMED, STATE_FUNDED, STATE_REFUNDED
+from regtest import RegtestNode
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def setup_contract(node: RegtestNode, real_k: str, blocks_to_locktime: int) -> Tuple[CScript, str, int, int]:
+    """Create and fund wallets, then build, fund and register one contract."""
+    keys = {}
+    for role in ("seller", "buyer"):
+        wallet = f"{role}wallet"
+        node.call("createwallet", wallet, "false", "false", '""', "false", "false")
+        address = node.call(f"-rpcwallet={wallet}", "getnewaddress")
+        node.call("generatetoaddress", "101", address)
+        keys[role] = x(node.call(f"-rpcwallet={wallet}", "getaddressinfo", address)["pubkey"])
+
+    hashk = hashlib.sha256(real_k.encode()).digest()
+    locktime = node.call("getblockcount") + blocks_to_locktime
+    redeem_script = build_redeem_script(hashk, keys["seller"], locktime, keys["buyer"])
+
+    address = P2SHBitcoinAddress.from_redeemScript(redeem_script)
+    txid = node.call("-rpcwallet=buyerwallet", "sendtoaddress", str(address), "1.0")
+    funding = CTransaction.deserialize(x(node.call("getrawtransaction", txid)))
+    vout = next(n for n, txout in enumerate(funding.vout)
+                if txout.scriptPubKey == redeem_script.to_p2sh_scriptPubKey())
+    node.call("generatetoaddress", "1", node.call("-rpcwallet=buyerwallet", "getnewaddress"))
+
+    registry = ContractRegistry(os.path.join(node.datadir, "contracts.db"))
+    registry.add(hashk, bytes(redeem_script), locktime, "sellerwallet", "buyerwallet")
+    registry.mark_funded(script_hash(bytes(redeem_script)), bytes.fromhex(txid), vout, 100000000)
+    registry.close()
+    return redeem_script, txid, vout, locktime
+
+def run_script(node: RegtestNode, *args: str) -> None:
+    """Run one of the ZKCP entry points against the node, failing on a non-zero exit."""
+    result = subprocess.run([sys.executable, *args], cwd=HERE, env=node.env(),
+                            text=True, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{args[0]} exited with {result.returncode}:\n{result.stdout}{result.stderr}")
+
+def spend_of(node: RegtestNode, redeem_script: CScript, state: str) -> CTransaction:
+    """The transaction the registry recorded as spending the contract, checking its state."""
+    registry = ContractRegistry(os.path.join(node.datadir, "contracts.db"))
+    contract = registry.by_script_hash(script_hash(bytes(redeem_script)))
+    registry.close()
+    if contract["state"] != state:
+        raise AssertionError(f"Contract is {contract['state']}, expected {state}")
+    return CTransaction.deserialize(x(node.call("getrawtransaction", contract["spend_txid"].hex())))
+
+def scenario_claim(node: RegtestNode) -> None:
+    """Seller claims by revealing K and the buyer extracts K from the chain."""
+    real_k = os.urandom(8).hex()
+    redeem_script, txid, vout, locktime = setup_contract(node, real_k, 100)
+    run_script(node, "zkcp_complete_tx.py", real_k, str(locktime),
+               redeem_script.hex(), txid, str(vout), "1.0",
+               "--registry", os.path.join(node.datadir, "contracts.db"))
+
+    revealed_k = list(spend_of(node, redeem_script, STATE_CLAIMED).vin[0].scriptSig)[-2]
+    if revealed_k != real_k.encode():
+        raise AssertionError(f"Extracted K {revealed_k!r} does not match {real_k!r}")
+
+def scenario_refund(node: RegtestNode) -> None:
+    """Buyer takes the CLTV branch once the locktime has passed."""
+    redeem_script, _, _, _ = setup_contract(node, os.urandom(8).hex(), 5)
+    node.call("generatetoaddress", "5", node.call("-rpcwallet=buyerwallet", "getnewaddress"))
+    run_script(node, "refund.py", "--db", os.path.join(node.datadir, "contracts.db"), "--once")
+    spend_of(node, redeem_script, STATE_REFUNDED)
+
+def scenario_early_refund(node: RegtestNode) -> None:
+    """A refund before the locktime must not be broadcast."""
+    redeem_script, _, _, _ = setup_contract(node, os.urandom(8).hex(), 50)
+    run_script(node, "refund.py", "--db", os.path.join(node.datadir, "contracts.db"), "--once")
+    registry = ContractRegistry(os.path.join(node.datadir, "contracts.db"))
+    state = registry.by_script_hash(script_hash(bytes(redeem_script)))["state"]
+    registry.close()
+    if state != STATE_FUNDED:
+        raise AssertionError(f"Contract is {state} before its locktime")
+
+SCENARIOS = {
+    "claim": scenario_claim,
+    "refund": scenario_refund,
+    "early_refund": scenario_early_refund,
+}
+
+def run_scenario(name: str) -> Dict[str, Any]:
+    """Process pool worker: run one scenario on a fresh node."""
+    start = time.perf_counter()
+    try:
+        with RegtestNode(extra_args=["-txindex=1"]) as node:
+            SCENARIOS[name](node)
+    except Exception as e:
+        return {"scenario": name, "ok": False, "seconds": round(time.perf_counter() - start, 3), "error": str(e)}
+    return {"scenario": name, "ok": True, "seconds": round(time.perf_counter() - start, 3)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ZKCP end-to-end scenarios on isolated regtest nodes")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of each scenario")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Nodes running at once")
+
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    names = (args.scenarios or list(SCENARIOS)) * args.repeat
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        results = list(pool.map(run_scenario, names))
+
+    for result in results:
+        status = "ok" if result["ok"] else "FAILED"
+        print(f"[*] {result['scenario']}: {status} ({result['seconds']}s)")
+        if not result["ok"]:
+            print(f"    {result['error']}")
+    failed = [r for r in results if not r["ok"]]
+    print(json.dumps({"runs": len(results), "failed": len(failed),
+                      "elapsed_s": round(time.perf_counter() - start, 3)}))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
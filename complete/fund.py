@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+ZKCP Bulk Funding - Pays many contracts' P2SH addresses in one sendmany transaction
+"""
+
+import argparse
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from bitcoin.core import x, CScript, CTransaction
+from bitcoin.wallet import P2SHBitcoinAddress
+from registry import ContractRegistry, script_hash
+from regtest import BITCOIN_CLI, rpc, RPCError
+from wallets import WalletPool
+
+# Keeps each funding transaction well under the 100 kvB standardness limit
+MAX_OUTPUTS = 1000
+
+# Called with the wallet and the (redeem script, satoshis, txid, vout) of each
+# contract as soon as their funding transaction is sent
+ChunkCallback = Callable[[str, List[Tuple[CScript, int, str, int]]], None]
+
+def check_unique(contracts: List[Tuple[CScript, int]]) -> None:
+    """Raise ValueError if a contract is listed twice, before anything is paid."""
+    seen = set()
+    for redeem_script, _ in contracts:
+        if bytes(redeem_script) in seen:
+            raise ValueError(f"Contract {redeem_script.hex()} is listed twice")
+        seen.add(bytes(redeem_script))
+
+def fund_many(contracts: List[Tuple[CScript, int]], wallet: str = "buyerwallet",
+              max_outputs: int = MAX_OUTPUTS,
+              on_chunk: Optional[ChunkCallback] = None) -> Dict[bytes, Tuple[str, int]]:
+    """Fund (redeem script, satoshis) pairs with as few sendmany calls as possible.
+
+    Returns the funding outpoint (txid, vout) of each contract keyed by redeem
+    script. If a chunk fails, the chunks before it have already been passed
+    to on_chunk.
+    """
+    check_unique(contracts)
+    outpoints = {}
+    for i in range(0, len(contracts), max_outputs):
+        chunk = contracts[i:i + max_outputs]
+        amounts = {
+            str(P2SHBitcoinAddress.from_redeemScript(redeem_script)): f"{amount / 100000000:.8f}"
+            for redeem_script, amount in chunk
+        }
+
+        txid = rpc(f"{BITCOIN_CLI} -rpcwallet={wallet} sendmany \"\" '{json.dumps(amounts)}'")["result"]
+        try:
+            tx_hex = rpc(f"{BITCOIN_CLI} -rpcwallet={wallet} gettransaction {txid}")["hex"]
+        except RPCError as e:
+            raise RPCError(f"Sent {txid} from {wallet} but could not read it back: {e}")
+        vouts = {txout.scriptPubKey: n for n, txout in enumerate(CTransaction.deserialize(x(tx_hex)).vout)}
+        funded = [
+            (redeem_script, amount, txid, vouts[redeem_script.to_p2sh_scriptPubKey()])
+            for redeem_script, amount in chunk
+        ]
+        for redeem_script, _, _, vout in funded:
+            outpoints[bytes(redeem_script)] = (txid, vout)
+        if on_chunk:
+            on_chunk(wallet, funded)
+    return outpoints
+
+def fund_sharded(contracts: List[Tuple[CScript, int]], wallets: WalletPool,
+                 max_outputs: int = MAX_OUTPUTS,
+                 on_chunk: Optional[ChunkCallback] = None,
+                 assigned: Optional[Dict[bytes, str]] = None) -> Dict[bytes, Tuple[str, int]]:
+    """Split contracts across the buyer wallet pool and fund each share concurrently.
+
+    Contracts in `assigned` (script hash -> wallet, e.g. from the registry)
+    are paid by that wallet, the rest by the pool's pick for their script
+    hash. Every share runs to completion or failure before a RuntimeError
+    listing the failed wallets is raised, so on_chunk sees everything paid.
+    """
+    check_unique(contracts)
+    assigned = assigned or {}
+    shares: Dict[str, List[Tuple[CScript, int]]] = {}
+    for redeem_script, amount in contracts:
+        sh = script_hash(bytes(redeem_script))
+        wallet = assigned.get(sh) or wallets.pick(sh)
+        shares.setdefault(wallet, []).append((redeem_script, amount))
+
+    outpoints = {}
+    failures = []
+    with ThreadPoolExecutor(max_workers=len(shares) or 1) as pool:
+        futures = {wallet: pool.submit(fund_many, share, wallet, max_outputs, on_chunk)
+                   for wallet, share in shares.items()}
+        for wallet, future in futures.items():
+            try:
+                outpoints.update(future.result())
+            except Exception as e:
+                failures.append(f"{wallet}: {e}")
+    if failures:
+        raise RuntimeError(f"Funding failed in {len(failures)} of {len(shares)} wallets: {'; '.join(failures)}")
+    return outpoints
+
+def main():
+    parser = argparse.ArgumentParser(description="Fund many ZKCP contracts in one transaction")
+    parser.add_argument("contracts", help="File with one '<redeem script hex> <amount BTC>' pair per line")
+    parser.add_argument("--wallets", help="Comma separated buyer wallets (default: ZKCP_BUYER_WALLETS)")
+    parser.add_argument("--max-outputs", type=int, default=MAX_OUTPUTS, help="Contracts per funding transaction")
+    parser.add_argument("--registry", help="Contract registry database to mark the contracts funded in")
+
+    args = parser.parse_args()
+
+    contracts = []
+    with open(args.contracts) as f:
+        for line in f:
+            if line.strip():
+                redeem_script, amount = line.split()
+                contracts.append((CScript(x(redeem_script)), round(float(amount) * 100000000)))
+
+    lock = threading.Lock()
+
+    def record(wallet: str, funded: List[Tuple[CScript, int, str, int]]) -> None:
+        # Written as each transaction is sent, so a later failure cannot lose them
+        with lock:
+            print(json.dumps({rs.hex(): f"{txid}:{vout}" for rs, _, txid, vout in funded}), flush=True)
+            if args.registry:
+                registry = ContractRegistry(args.registry)
+                try:
+                    registry.mark_funded_many(
+                        (script_hash(bytes(rs)), bytes.fromhex(txid), vout, amount, wallet)
+                        for rs, amount, txid, vout in funded
+                    )
+                finally:
+                    registry.close()
+
+    print(f"[*] Funding {len(contracts)} contracts...")
+    wallets = WalletPool(args.wallets.split(",")) if args.wallets else WalletPool.from_env("buyer")
+    assigned = {}
+    if args.registry:
+        # Pay from the wallet holding each contract's buyer key where it is known
+        registry = ContractRegistry(args.registry)
+        assigned = registry.buyer_wallets(script_hash(bytes(rs)) for rs, _ in contracts)
+        registry.close()
+    try:
+        outpoints = fund_sharded(contracts, wallets, args.max_outputs, record, assigned)
+    except (ValueError, RuntimeError) as e:
+        print(f"[!] {e}")
+        sys.exit(1)
+    print(f"[*] Sent {len({txid for txid, _ in outpoints.values()})} funding transactions")
+    if args.registry:
+        print(f"[*] Contracts marked as funded in {args.registry}")
+
+if __name__ == "__main__":
+    main()
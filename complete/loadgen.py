@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+ZKCP Load Generator - Runs many full settlements concurrently and reports per-phase latency
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+from bitcoin.core import (
+    b2x, b2lx, x, CMutableTransaction, CMutableTxIn,
+    CMutableTxOut, COutPoint, CScript, CTransaction
+)
+from bitcoin.core.scripteval import VerifyScript
+from bitcoin.wallet import CBitcoinSecret, P2PKHBitcoinAddress, P2SHBitcoinAddress
+from asm import build_redeem_script
+from regtest import BITCOIN_CLI, rpc, RPCError
+from refund import build_refund_tx
+from registry import script_hash
+from verify import check_encoding, check_locktime, STANDARD_FLAGS
+from wallets import WalletPool
+from zkcp_complete_tx import build_claim_at_rate, FALLBACK_FEE_RATE
+
+PHASES = ("hash", "script", "fund", "claim", "refund", "extract")
+
+class RegtestBackend:
+    """Talks to a running regtest node through bitcoin-cli.
+
+    The node must run with -txindex=1, so the buyer can still read K out of
+    a claim once the background miner has confirmed it. Failures raise
+    RPCError, so one bad settlement is reported instead of ending the run.
+    """
+
+    def __init__(self, wallets: WalletPool, block_interval: float = 1.0):
+        if "txindex" not in rpc(f"{BITCOIN_CLI} getindexinfo"):
+            raise RuntimeError("The regtest backend needs bitcoind running with -txindex=1")
+        self.wallets = wallets
+        self.block_interval = block_interval
+        # Mining rewards rotate over the pool so every buyer wallet has coins to fund with
+        self.mine_addresses = itertools.cycle([
+            rpc(f"{BITCOIN_CLI} -rpcwallet={wallet} getnewaddress")["result"]
+            for wallet in wallets.names
+        ])
+        self.stopped = threading.Event()
+        # Keep unconfirmed funding chains under the node's mempool ancestor limit
+        self.miner = threading.Thread(target=self._mine, daemon=True)
+        self.miner.start()
+
+    def _mine(self) -> None:
+        while not self.stopped.wait(self.block_interval):
+            try:
+                rpc(f"{BITCOIN_CLI} generatetoaddress 1 {next(self.mine_addresses)}")
+            except RPCError as e:
+                print(f"[!] Mining failed: {e}")
+
+    def close(self) -> None:
+        self.stopped.set()
+        self.miner.join()
+
+    def height(self) -> int:
+        return rpc(f"{BITCOIN_CLI} getblockchaininfo")["blocks"]
+
+    def fund(self, redeem_script: CScript, amount: int) -> Tuple[str, int]:
+        address = P2SHBitcoinAddress.from_redeemScript(redeem_script)
+        wallet = self.wallets.pick(script_hash(bytes(redeem_script)))
+        txid = rpc(f"{BITCOIN_CLI} -rpcwallet={wallet} sendtoaddress {address} {amount / 100000000:.8f}")["result"]
+        # The funding wallet knows its own transaction whether or not it is mined yet
+        tx = CTransaction.deserialize(x(rpc(f"{BITCOIN_CLI} -rpcwallet={wallet} gettransaction {txid}")["hex"]))
+        script_pub_key = redeem_script.to_p2sh_scriptPubKey()
+        vout = next(i for i, txout in enumerate(tx.vout) if txout.scriptPubKey == script_pub_key)
+        return txid, vout
+
+    def broadcast(self, tx: CTransaction) -> str:
+        rpc(f"{BITCOIN_CLI} sendrawtransaction {b2x(tx.serialize())}")
+        return b2lx(tx.GetTxid())
+
+    def get_tx(self, txid: str) -> CTransaction:
+        return CTransaction.deserialize(x(rpc(f"{BITCOIN_CLI} getrawtransaction {txid}")["result"]))
+
+class LocalBackend:
+    """In-memory stand-in for the node: a UTXO set plus script verification on broadcast."""
+
+    def __init__(self, rpc_latency: float = 0.0):
+        self.rpc_latency = rpc_latency
+        self.lock = threading.Lock()
+        self.utxos: Dict[Tuple[bytes, int], CMutableTxOut] = {}
+        self.txs: Dict[str, CTransaction] = {}
+
+    def close(self) -> None:
+        pass
+
+    def _round_trip(self) -> None:
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+
+    def height(self) -> int:
+        self._round_trip()
+        return 200
+
+    def fund(self, redeem_script: CScript, amount: int) -> Tuple[str, int]:
+        self._round_trip()
+        txin = CMutableTxIn(COutPoint(os.urandom(32), 0))
+        tx = CMutableTransaction([txin], [CMutableTxOut(amount, redeem_script.to_p2sh_scriptPubKey())])
+        with self.lock:
+            self.utxos[(tx.GetTxid(), 0)] = tx.vout[0]
+            self.txs[b2lx(tx.GetTxid())] = tx
+        return b2lx(tx.GetTxid()), 0
+
+    def broadcast(self, tx: CTransaction) -> str:
+        self._round_trip()
+        prevout = tx.vin[0].prevout
+        with self.lock:
+            utxo = self.utxos.pop((prevout.hash, prevout.n))
+        script_sig = tx.vin[0].scriptSig
+        VerifyScript(script_sig, utxo.scriptPubKey, tx, 0, STANDARD_FLAGS)
+        check_encoding(script_sig, CScript(list(script_sig)[-1]))
+        check_locktime(tx, CScript(list(script_sig)[-1]))
+        with self.lock:
+            self.txs[b2lx(tx.GetTxid())] = tx
+        return b2lx(tx.GetTxid())
+
+    def get_tx(self, txid: str) -> CTransaction:
+        self._round_trip()
+        with self.lock:
+            return self.txs[txid]
+
+def settle(backend, path: str, amount: int, k_size: int) -> Dict[str, float]:
+    """Run one buyer/seller settlement, returning the seconds spent in each phase."""
+    timings = {}
+    seller_key = CBitcoinSecret.from_secret_bytes(os.urandom(32))
+    buyer_key = CBitcoinSecret.from_secret_bytes(os.urandom(32))
+
+    start = time.perf_counter()
+    real_k = os.urandom(k_size)
+    hashk = hashlib.sha256(real_k).digest()
+    timings["hash"] = time.perf_counter() - start
+
+    # Refund contracts get a locktime that has already passed
+    start = time.perf_counter()
+    locktime = backend.height() if path == "refund" else backend.height() + 100
+    redeem_script = build_redeem_script(hashk, seller_key.pub, locktime, buyer_key.pub)
+    timings["script"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    txid, vout = backend.fund(redeem_script, amount)
+    timings["fund"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if path == "refund":
+        script_pub_key = P2PKHBitcoinAddress.from_pubkey(buyer_key.pub).to_scriptPubKey()
+        tx = build_refund_tx(redeem_script, bytes.fromhex(txid), vout, amount, locktime, buyer_key, script_pub_key)
+        backend.broadcast(tx)
+        timings["refund"] = time.perf_counter() - start
+        return timings
+
+    script_pub_key = P2PKHBitcoinAddress.from_pubkey(seller_key.pub).to_scriptPubKey()
+    tx = build_claim_at_rate(redeem_script, txid, vout, amount, real_k, seller_key,
+                             script_pub_key, FALLBACK_FEE_RATE)
+    claim_txid = backend.broadcast(tx)
+    timings["claim"] = time.perf_counter() - start
+
+    # Buyer reads K back out of the claim's scriptSig
+    start = time.perf_counter()
+    revealed_k = list(backend.get_tx(claim_txid).vin[0].scriptSig)[-2]
+    if hashlib.sha256(revealed_k).digest() != hashk:
+        raise ValueError(f"Extracted K does not match hashk in {claim_txid}")
+    timings["extract"] = time.perf_counter() - start
+    return timings
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test full ZKCP settlements")
+    parser.add_argument("--pairs", type=int, default=100, help="Number of buyer/seller settlements")
+    parser.add_argument("--concurrency", type=int, default=8, help="Settlements in flight at once")
+    parser.add_argument("--refund-ratio", type=float, default=0.0, help="Fraction of contracts settled by refund")
+    parser.add_argument("--amount", type=float, default=0.01, help="Amount locked per contract (BTC)")
+    parser.add_argument("--k-size", type=int, default=32, help="Length of K in bytes")
+    parser.add_argument("--backend", choices=("local", "regtest"), default="local", help="Node to settle against")
+    parser.add_argument("--rpc-latency", type=float, default=0.0, help="Simulated round trip of the local backend (ms)")
+    parser.add_argument("--wallets", help="Comma separated buyer wallets funding on regtest (default: ZKCP_BUYER_WALLETS)")
+    parser.add_argument("--block-interval", type=float, default=1.0, help="Seconds between blocks mined on regtest")
+    parser.add_argument("--seed", type=int, help="Seed for the contract mix")
+
+    args = parser.parse_args()
+
+    if args.backend == "regtest":
+        wallets = WalletPool(args.wallets.split(",")) if args.wallets else WalletPool.from_env("buyer")
+        wallets.ensure()
+        backend = RegtestBackend(wallets, args.block_interval)
+    else:
+        backend = LocalBackend(args.rpc_latency / 1000)
+
+    rng = random.Random(args.seed)
+    paths = ["refund" if rng.random() < args.refund_ratio else "claim" for _ in range(args.pairs)]
+    amount = round(args.amount * 100000000)
+
+    phase_samples: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+    totals: List[float] = []
+    errors: List[str] = []
+
+    def run(path: str) -> None:
+        start = time.perf_counter()
+        try:
+            timings = settle(backend, path, amount, args.k_size)
+        except Exception as e:
+            errors.append(f"{path}: {e}")
+            return
+        totals.append(time.perf_counter() - start)
+        for phase, seconds in timings.items():
+            phase_samples[phase].append(seconds)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(run, paths))
+    elapsed = time.perf_counter() - start
+    backend.close()
+
+    print(json.dumps({
+        "backend": args.backend,
+        "pairs": args.pairs,
+        "concurrency": args.concurrency,
+        "refund_ratio": args.refund_ratio,
+        "elapsed_s": round(elapsed, 3),
+        "settlements_per_s": round(len(totals) / elapsed, 3),
+        "errors": len(errors),
+        "first_errors": errors[:5],
+        "total": summarize(totals) if totals else None,
+        "phases": {phase: summarize(s) for phase, s in phase_samples.items() if s},
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
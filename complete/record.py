@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+ZKCP Contract Record - Compact in-memory contract with a fixed-layout binary format
+"""
+
+import argparse
+import io
+import json
+import struct
+import time
+import tracemalloc
+from typing import BinaryIO, Iterable, Iterator
+from bitcoin.core import b2lx, lx, x, COutPoint, CScript
+from asm import build_redeem_script
+
+# hashk, seller pubkey, buyer pubkey, txid, vout, amount (sat), locktime
+RECORD = struct.Struct("<32s33s33s32sIqI")
+
+# struct pads or truncates "Ns" fields silently, so lengths are checked up front
+FIELD_SIZES = (("hashk", 32), ("seller_pubkey", 33), ("buyer_pubkey", 33), ("txid", 32))
+
+class ContractRecord:
+    """One contract as raw bytes and integer satoshis.
+
+    `txid` is kept in internal byte order, as used by COutPoint.
+    """
+
+    __slots__ = ("hashk", "seller_pubkey", "buyer_pubkey", "txid", "vout", "amount", "locktime")
+
+    def __init__(self, hashk: bytes, seller_pubkey: bytes, buyer_pubkey: bytes,
+                 txid: bytes, vout: int, amount: int, locktime: int):
+        for (name, size), value in zip(FIELD_SIZES, (hashk, seller_pubkey, buyer_pubkey, txid)):
+            if len(value) != size:
+                raise ValueError(f"{name} must be {size} bytes, got {len(value)}")
+        self.hashk = hashk
+        self.seller_pubkey = seller_pubkey
+        self.buyer_pubkey = buyer_pubkey
+        self.txid = txid
+        self.vout = vout
+        self.amount = amount
+        self.locktime = locktime
+
+    @classmethod
+    def from_hex(cls, hashk: str, seller_pubkey: str, buyer_pubkey: str,
+                 txid: str, vout: int, amount: float, locktime: int) -> "ContractRecord":
+        """Build a record from the hex and BTC values the shell scripts pass around."""
+        return cls(x(hashk), x(seller_pubkey), x(buyer_pubkey), lx(txid), vout,
+                   round(amount * 100000000), locktime)
+
+    @property
+    def redeem_script(self) -> CScript:
+        return build_redeem_script(self.hashk, self.seller_pubkey, self.locktime, self.buyer_pubkey)
+
+    @property
+    def outpoint(self) -> COutPoint:
+        return COutPoint(self.txid, self.vout)
+
+    def pack(self) -> bytes:
+        return RECORD.pack(self.hashk, self.seller_pubkey, self.buyer_pubkey,
+                           self.txid, self.vout, self.amount, self.locktime)
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "ContractRecord":
+        return cls(*RECORD.unpack(data))
+
+    def to_json(self) -> dict:
+        return {
+            "hashk": self.hashk.hex(),
+            "seller_pubkey": self.seller_pubkey.hex(),
+            "buyer_pubkey": self.buyer_pubkey.hex(),
+            "txid": b2lx(self.txid),
+            "vout": self.vout,
+            "amount": self.amount / 100000000,
+            "locktime": self.locktime,
+        }
+
+def write_records(f: BinaryIO, records: Iterable[ContractRecord]) -> int:
+    """Stream records to a binary file, returning how many were written."""
+    count = 0
+    for record in records:
+        f.write(record.pack())
+        count += 1
+    return count
+
+def read_records(f: BinaryIO, batch: int = 4096) -> Iterator[ContractRecord]:
+    """Stream records back from a binary file, reading `batch` records at a time."""
+    while True:
+        data = f.read(RECORD.size * batch)
+        if not data:
+            return
+        if len(data) % RECORD.size:
+            raise ValueError("Truncated contract record")
+        for fields in RECORD.iter_unpack(data):
+            yield ContractRecord(*fields)
+
+def sample_record(i: int) -> ContractRecord:
+    """Deterministic record for benchmarking."""
+    def fill(prefix: bytes, n: int) -> bytes:
+        return (prefix + i.to_bytes(4, "big") * 9)[:n]
+    return ContractRecord(fill(b"", 32), fill(b"\x02", 33), fill(b"\x03", 33),
+                          fill(b"", 32), i % 4, 100000000, 300 + i)
+
+def measure_memory(build, n: int) -> float:
+    """Bytes allocated per item by build(i) while holding n items."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = [build(i) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    return (after - before) / n
+
+def measure_seconds(fn, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items)
+
+def measure_stream(data: bytes, n: int) -> float:
+    start = time.perf_counter()
+    for _ in read_records(io.BytesIO(data)):
+        pass
+    return (time.perf_counter() - start) / n
+
+def parse_json(line: str) -> tuple:
+    """The current per-step handling: hex/float fields re-parsed from text."""
+    fields = json.loads(line)
+    return (x(fields["hashk"]), x(fields["seller_pubkey"]), x(fields["buyer_pubkey"]),
+            lx(fields["txid"]), fields["vout"], int(fields["amount"] * 100000000), fields["locktime"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure compact contract records against hex/JSON")
+    parser.add_argument("--count", type=int, default=100000, help="Number of records to measure")
+
+    args = parser.parse_args()
+
+    records = [sample_record(i) for i in range(args.count)]
+    json_lines = [json.dumps(r.to_json()) for r in records]
+    packed = [r.pack() for r in records]
+
+    print(json.dumps({
+        "count": args.count,
+        "bytes_per_contract": {
+            "json_dict": round(measure_memory(lambda i: json.loads(json_lines[i]), args.count), 1),
+            "json_text": round(sum(len(line) for line in json_lines) / args.count, 1),
+            "record": round(measure_memory(lambda i: ContractRecord.unpack(packed[i]), args.count), 1),
+            "binary": RECORD.size,
+        },
+        "parse_us": {
+            "json_hex": round(measure_seconds(parse_json, json_lines) * 1e6, 3),
+            "record": round(measure_seconds(ContractRecord.unpack, packed) * 1e6, 3),
+            "record_stream": round(measure_stream(b"".join(packed), args.count) * 1e6, 3),
+        },
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
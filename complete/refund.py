@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+ZKCP Refund Scheduler - Builds CLTV refund spends and broadcasts them as their locktime passes
+"""
+
+import argparse
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+import bitcoin.core.key
+from bitcoin.core import (
+    b2x, b2lx, lx, x, CMutableTransaction,
+    CMutableTxIn, CMutableTxOut, COutPoint, CScript, CTransaction
+)
+from bitcoin.core.script import (
+    SignatureHash,
+    SIGHASH_ALL
+)
+from bitcoin.wallet import CBitcoinSecret, P2PKHBitcoinAddress
+from registry import ContractRegistry, InvalidTransition, STATE_FUNDED, STATE_REFUNDED
+from regtest import BITCOIN_CLI, rpc, run_command, RPCError
+from verify import verify_batch
+from wallets import WalletPool
+
+# Highest nSequence that still enforces nLockTime
+REFUND_SEQUENCE = 0xfffffffe
+
+# Position of the buyer pubkey in the complete/asm.py redeem script
+BUYER_PUBKEY_INDEX = 9
+
+# sendrawtransaction rejections meaning this exact refund already reached the node
+ALREADY_SENT = ("txn-already-in-mempool", "txn-already-known", "already in block chain")
+
+# Rejections meaning the funding output is gone or taken in the mempool, by our
+# earlier refund or by the seller's claim
+INPUTS_SPENT = ("missingorspent", "missing-inputs", "Missing inputs", "txn-mempool-conflict")
+
+def buyer_pubkey(redeem_script: CScript) -> bytes:
+    """Extract the buyer's pubkey from the ELSE branch of the redeem script."""
+    return list(redeem_script)[BUYER_PUBKEY_INDEX]
+
+def build_refund_tx(redeem_script: CScript, txid: bytes, vout: int, amount: int,
+                    locktime: int, buyer_key: CBitcoinSecret, script_pub_key: CScript,
+                    fee: int = 10000) -> CMutableTransaction:
+    """Build and sign a spend of the ELSE (CLTV) branch back to the buyer.
+
+    `txid` is in RPC byte order, `amount` and `fee` are in satoshis.
+    """
+    txin = CMutableTxIn(COutPoint(lx(txid.hex()), vout), nSequence=REFUND_SEQUENCE)
+    txout = CMutableTxOut(amount - fee, script_pub_key)
+    tx = CMutableTransaction([txin], [txout], nLockTime=locktime)
+
+    sighash = SignatureHash(redeem_script, tx, 0, SIGHASH_ALL)
+    sig = buyer_key.sign(sighash) + bytes([SIGHASH_ALL])
+
+    # The scriptSig structure for the ELSE branch is:
+    # <signature> <empty, so SHA256 does not match hashk> <redeemScript>
+    tx.vin[0].scriptSig = CScript([sig, b"", redeem_script])
+    return tx
+
+class RefundScheduler:
+    """Min-heap of pending refunds keyed by locktime.
+
+    Each new block only pops the contracts that just became spendable, so the
+    cost per block is proportional to the number of eligible refunds rather
+    than the number of pending contracts.
+    """
+
+    def __init__(self, wallets: Optional[WalletPool] = None):
+        self.wallets = wallets or WalletPool.from_env("buyer")
+        # RFC6979 nonces, so a re-signed refund has the same txid as the one sent
+        # before a restart. OpenSSL signing (the default) uses random nonces.
+        if bitcoin.core.key.is_libsec256k1_available():
+            bitcoin.core.key.use_libsecp256k1_for_signing(True)
+        self.heap: List[Tuple[int, int, Dict[str, Any]]] = []
+        self.counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def add(self, contract: Dict[str, Any]) -> None:
+        """Queue a funded contract row (as returned by ContractRegistry)."""
+        heapq.heappush(self.heap, (contract["locktime"], next(self.counter), contract))
+
+    def next_locktime(self) -> Optional[int]:
+        return self.heap[0][0] if self.heap else None
+
+    def pop_eligible(self, height: int) -> List[Dict[str, Any]]:
+        """Pop every contract whose refund can enter the mempool at this tip height."""
+        eligible = []
+        while self.heap and self.heap[0][0] <= height:
+            eligible.append(heapq.heappop(self.heap)[2])
+        return eligible
+
+    def wallet(self, contract: Dict[str, Any]) -> str:
+        """Buyer wallet holding the refund key, as recorded in the registry or found in the pool."""
+        if contract.get("buyer_wallet"):
+            return contract["buyer_wallet"]
+        address = P2PKHBitcoinAddress.from_pubkey(buyer_pubkey(CScript(contract["redeem_script"])))
+        return self.wallets.owner(str(address))
+
+    def sign(self, contract: Dict[str, Any], wallet: Optional[str] = None) -> CMutableTransaction:
+        """Build and sign the refund of one contract with the buyer's wallet key.
+
+        The refund pays back to the address of the buyer pubkey in the script,
+        so every signing of a contract's refund has the same output.
+        """
+        redeem_script = CScript(contract["redeem_script"])
+        address = P2PKHBitcoinAddress.from_pubkey(buyer_pubkey(redeem_script))
+        wallet = wallet or self.wallet(contract)
+        privkey = rpc(f"{BITCOIN_CLI} -rpcwallet={wallet} dumpprivkey {address}")["result"]
+
+        return build_refund_tx(
+            redeem_script, contract["txid"], contract["vout"], contract["amount"],
+            contract["locktime"], CBitcoinSecret(privkey), address.to_scriptPubKey()
+        )
+
+    def sent_refund(self, contract: Dict[str, Any]) -> Optional[str]:
+        """Txid of a refund of this contract the buyer wallet already has, if any."""
+        address = P2PKHBitcoinAddress.from_pubkey(buyer_pubkey(CScript(contract["redeem_script"])))
+        outpoint = COutPoint(lx(contract["txid"].hex()), contract["vout"])
+        wallet = self.wallet(contract)
+        received = rpc(f'{BITCOIN_CLI} -rpcwallet={wallet} listreceivedbyaddress 0 true true "{address}"')
+        for entry in received:
+            for txid in entry["txids"]:
+                tx = CTransaction.deserialize(x(rpc(f"{BITCOIN_CLI} -rpcwallet={wallet} gettransaction {txid}")["hex"]))
+                if any(txin.prevout == outpoint for txin in tx.vin):
+                    return txid
+        return None
+
+    def _sign_share(self, wallet: str, contracts: List[Dict[str, Any]]) -> List[Union[CMutableTransaction, Exception]]:
+        signed = []
+        for contract in contracts:
+            try:
+                signed.append(self.sign(contract, wallet))
+            except RPCError as e:
+                signed.append(e)
+        return signed
+
+    def reconcile(self, contract: Dict[str, Any], txid: str, error: str) -> Optional[str]:
+        """Txid of the refund that already went out if the node rejected this one for it.
+
+        A funding output taken by someone else (the seller's claim) is left
+        alone; other rejections requeue the contract for the next block.
+        """
+        if any(reason in error for reason in ALREADY_SENT):
+            return txid
+        if any(reason in error for reason in INPUTS_SPENT):
+            try:
+                # Sent before a restart and never recorded
+                sent = self.sent_refund(contract)
+            except (RPCError, KeyError) as e:
+                sent = None
+                print(f"[!] Could not look up earlier refunds of {contract['script_hash'].hex()}: {e}")
+            if sent:
+                return sent
+            if "txn-mempool-conflict" in error:
+                # The seller's claim is in the mempool; try again in case it is dropped
+                self.add(contract)
+            print(f"[!] Output of {contract['script_hash'].hex()} was spent by another transaction")
+            return None
+        print(f"[!] Refund of {contract['script_hash'].hex()} rejected, retrying next block: {error}")
+        self.add(contract)
+        return None
+
+    def refund_all(self, contracts: List[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], str]]:
+        """Sign, verify in parallel and broadcast refunds, yielding (contract, txid) as each is accepted.
+
+        Refunds the node already has are yielded too, so every yielded
+        contract can be recorded as refunded straight away.
+        """
+        shares: Dict[str, List[Dict[str, Any]]] = {}
+        for contract in contracts:
+            try:
+                shares.setdefault(self.wallet(contract), []).append(contract)
+            except (RPCError, KeyError) as e:
+                print(f"[!] No wallet for refund of {contract['script_hash'].hex()}, retrying next block: {e}")
+                self.add(contract)
+
+        # One signer per wallet, since bitcoind serializes calls on each wallet
+        ready = []
+        with ThreadPoolExecutor(max_workers=len(shares) or 1) as pool:
+            futures = [(share, pool.submit(self._sign_share, wallet, share)) for wallet, share in shares.items()]
+            for share, future in futures:
+                for contract, tx in zip(share, future.result()):
+                    if isinstance(tx, Exception):
+                        print(f"[!] Could not sign refund of {contract['script_hash'].hex()}, retrying next block: {tx}")
+                        self.add(contract)
+                    else:
+                        ready.append((contract, tx))
+        errors = verify_batch((tx.serialize(), contract["redeem_script"]) for contract, tx in ready)
+
+        for (contract, tx), error in zip(ready, errors):
+            if error:
+                print(f"[!] Refund of {contract['script_hash'].hex()} failed local verification: {error}")
+                continue
+            txid = b2lx(tx.GetTxid())
+            try:
+                rpc(f"{BITCOIN_CLI} sendrawtransaction {b2x(tx.serialize())}")
+            except RPCError as e:
+                txid = self.reconcile(contract, txid, str(e))
+                if txid is None:
+                    continue
+            yield contract, txid
+
+    def on_block(self, height: int) -> Iterator[Tuple[Dict[str, Any], str]]:
+        """Broadcast the refunds that became eligible at this height."""
+        return self.refund_all(self.pop_eligible(height))
+
+def main():
+    parser = argparse.ArgumentParser(description="Broadcast ZKCP refunds as their locktime passes")
+    parser.add_argument("--db", default="zkcp_contracts.db", help="Contract registry database")
+    parser.add_argument("--wallets", help="Comma separated buyer wallets (default: ZKCP_BUYER_WALLETS)")
+    parser.add_argument("--once", action="store_true", help="Process the current tip and exit")
+
+    args = parser.parse_args()
+
+    registry = ContractRegistry(args.db)
+    scheduler = RefundScheduler(WalletPool(args.wallets.split(",")) if args.wallets else None)
+    funded_seq = 0
+    for contract in registry.funded():
+        scheduler.add(contract)
+        funded_seq = max(funded_seq, contract["funded_seq"] or 0)
+    print(f"[*] {len(scheduler)} pending refunds, next at height {scheduler.next_locktime()}")
+
+    height = run_command(f"{BITCOIN_CLI} getblockchaininfo")["blocks"]
+    try:
+        while True:
+            # The seller may have claimed some of them since they were queued
+            eligible = [
+                contract for contract in scheduler.pop_eligible(height)
+                if registry.by_script_hash(contract["script_hash"])["state"] == STATE_FUNDED
+            ]
+            # Recorded one by one, so a crash never loses a refund that was already sent
+            for contract, txid in scheduler.refund_all(eligible):
+                try:
+                    registry.mark_spent(contract["script_hash"], STATE_REFUNDED, bytes.fromhex(txid))
+                except InvalidTransition as e:
+                    print(f"[!] {e}")
+                    continue
+                print(f"[*] Refunded {contract['script_hash'].hex()} at height {height}: {txid}")
+            if args.once:
+                break
+            # Block until the tip changes instead of polling each contract
+            height = run_command(f"{BITCOIN_CLI} waitfornewblock")["height"]
+            for contract in registry.funded_since(funded_seq):
+                scheduler.add(contract)
+                funded_seq = contract["funded_seq"]
+    except KeyboardInterrupt:
+        print("\n[*] Stopping refund scheduler")
+    finally:
+        registry.close()
+
+if __name__ == "__main__":
+    main()
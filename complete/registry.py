@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+ZKCP Contract Registry - Persists contracts in SQLite and tracks their lifecycle
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from bitcoin.core import Hash160
+
+# Contract lifecycle: created -> funded -> claimed / refunded
+STATE_CREATED = "created"
+STATE_FUNDED = "funded"
+STATE_CLAIMED = "claimed"
+STATE_REFUNDED = "refunded"
+
+TRANSITIONS = {
+    STATE_CREATED: (STATE_FUNDED,),
+    STATE_FUNDED: (STATE_CLAIMED, STATE_REFUNDED),
+    STATE_CLAIMED: (),
+    STATE_REFUNDED: (),
+}
+
+SPEND_COMMANDS = {"claim": STATE_CLAIMED, "refund": STATE_REFUNDED}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contracts (
+    id INTEGER PRIMARY KEY,
+    hashk BLOB NOT NULL,
+    script_hash BLOB NOT NULL,
+    redeem_script BLOB NOT NULL,
+    locktime INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'created',
+    txid BLOB,
+    vout INTEGER,
+    amount INTEGER,
+    spend_txid BLOB,
+    seller_wallet TEXT,
+    buyer_wallet TEXT,
+    funded_seq INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_contracts_hashk ON contracts (hashk);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_contracts_script_hash ON contracts (script_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_contracts_outpoint ON contracts (txid, vout);
+CREATE INDEX IF NOT EXISTS idx_contracts_state_locktime ON contracts (state, locktime);
+"""
+
+# Created after the migrations, since funded_seq may be one of them
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_contracts_funded_seq ON contracts (funded_seq);
+"""
+
+COLUMNS = ("id", "hashk", "script_hash", "redeem_script", "locktime",
+           "state", "txid", "vout", "amount", "spend_txid",
+           "seller_wallet", "buyer_wallet", "funded_seq")
+
+# Columns added after the first schema, migrated in place on open
+ADDED_COLUMNS = {"seller_wallet": "TEXT", "buyer_wallet": "TEXT", "funded_seq": "INTEGER"}
+
+class InvalidTransition(Exception):
+    """Raised when a contract is moved to a state its current state cannot reach."""
+
+# OpenSSL 3 without the legacy provider has no ripemd160; python-bitcoinlib's
+# pure-Python Hash160 works everywhere but is about 60 times slower
+try:
+    hashlib.new("ripemd160")
+    HAVE_RIPEMD160 = True
+except ValueError:
+    HAVE_RIPEMD160 = False
+
+def script_hash(redeem_script: bytes) -> bytes:
+    """HASH160 of the redeem script, as committed to by the P2SH scriptPubKey."""
+    if HAVE_RIPEMD160:
+        return hashlib.new("ripemd160", hashlib.sha256(redeem_script).digest()).digest()
+    return Hash160(redeem_script)
+
+class ContractRegistry:
+    """SQLite-backed store of ZKCP contracts, indexed by hashk, script hash, outpoint and locktime."""
+
+    def __init__(self, path: str = "zkcp_contracts.db"):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(contracts)")}
+        for column, sql_type in ADDED_COLUMNS.items():
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE contracts ADD COLUMN {column} {sql_type}")
+        self.conn.executescript(INDEXES)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def add(self, hashk: bytes, redeem_script: bytes, locktime: int,
+            seller_wallet: Optional[str] = None, buyer_wallet: Optional[str] = None) -> int:
+        """Register a newly created contract and the wallets owning its keys, returning its id."""
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO contracts (hashk, script_hash, redeem_script, locktime, seller_wallet, buyer_wallet) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (hashk, script_hash(redeem_script), redeem_script, locktime, seller_wallet, buyer_wallet),
+            )
+        return cur.lastrowid
+
+    def add_many(self, contracts: Iterable[Tuple[bytes, bytes, int, Optional[str], Optional[str]]]) -> int:
+        """Register (hashk, redeem_script, locktime, seller_wallet, buyer_wallet) tuples in a single transaction."""
+        rows = (
+            (hashk, script_hash(rs), rs, locktime, seller_wallet, buyer_wallet)
+            for hashk, rs, locktime, seller_wallet, buyer_wallet in contracts
+        )
+        with self.conn:
+            cur = self.conn.executemany(
+                "INSERT INTO contracts (hashk, script_hash, redeem_script, locktime, seller_wallet, buyer_wallet) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return cur.rowcount
+
+    def mark_funded(self, sh: bytes, txid: bytes, vout: int, amount: int,
+                    buyer_wallet: Optional[str] = None) -> None:
+        """Record the funding outpoint (txid in RPC byte order, amount in satoshis)."""
+        self.mark_funded_many([(sh, txid, vout, amount, buyer_wallet)])
+
+    def mark_funded_many(self, fundings: Iterable[Tuple[bytes, bytes, int, int, Optional[str]]]) -> None:
+        """Record (script_hash, txid, vout, amount, buyer_wallet) fundings in a single transaction.
+
+        buyer_wallet is the wallet that paid, kept only if add() recorded none.
+        Each funding gets the next funded_seq, so watchers can pick up new
+        fundings with funded_since() whatever order the contracts were added in.
+        """
+        with self.conn:
+            for sh, txid, vout, amount, buyer_wallet in fundings:
+                self._check_transition(sh, STATE_FUNDED)
+                self.conn.execute(
+                    "UPDATE contracts SET state = ?, txid = ?, vout = ?, amount = ?, "
+                    "buyer_wallet = COALESCE(buyer_wallet, ?), "
+                    "funded_seq = (SELECT COALESCE(MAX(funded_seq), 0) + 1 FROM contracts) "
+                    "WHERE script_hash = ?",
+                    (STATE_FUNDED, txid, vout, amount, buyer_wallet, sh),
+                )
+
+    def buyer_wallets(self, script_hashes: Iterable[bytes]) -> Dict[bytes, str]:
+        """Recorded buyer wallet of each of the given contracts that has one."""
+        wallets = {}
+        for sh in script_hashes:
+            row = self.conn.execute("SELECT buyer_wallet FROM contracts WHERE script_hash = ?", (sh,)).fetchone()
+            if row and row[0]:
+                wallets[sh] = row[0]
+        return wallets
+
+    def mark_spent(self, sh: bytes, state: str, spend_txid: bytes) -> None:
+        """Move a funded contract to claimed or refunded."""
+        self.mark_spent_many([(sh, state, spend_txid)])
+
+    def mark_spent_many(self, spends: Iterable[Tuple[bytes, str, bytes]]) -> None:
+        """Record (script_hash, state, spend_txid) spends in a single transaction."""
+        with self.conn:
+            for sh, state, spend_txid in spends:
+                self._check_transition(sh, state)
+                self.conn.execute(
+                    "UPDATE contracts SET state = ?, spend_txid = ? WHERE script_hash = ?",
+                    (state, spend_txid, sh),
+                )
+
+    def _check_transition(self, sh: bytes, new_state: str) -> None:
+        row = self.conn.execute("SELECT state FROM contracts WHERE script_hash = ?", (sh,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown contract: {sh.hex()}")
+        if new_state not in TRANSITIONS[row[0]]:
+            raise InvalidTransition(f"Cannot move contract {sh.hex()} from {row[0]} to {new_state}")
+
+    def by_script_hash(self, sh: bytes) -> Optional[Dict[str, Any]]:
+        return self._one("SELECT * FROM contracts WHERE script_hash = ?", (sh,))
+
+    def by_outpoint(self, txid: bytes, vout: int) -> Optional[Dict[str, Any]]:
+        return self._one("SELECT * FROM contracts WHERE txid = ? AND vout = ?", (txid, vout))
+
+    def by_hashk(self, hashk: bytes) -> List[Dict[str, Any]]:
+        return self._all("SELECT * FROM contracts WHERE hashk = ?", (hashk,))
+
+    def funded(self) -> List[Dict[str, Any]]:
+        """Funded contracts that are neither claimed nor refunded yet."""
+        return self._all("SELECT * FROM contracts WHERE state = ? ORDER BY locktime", (STATE_FUNDED,))
+
+    def funded_since(self, seq: int) -> List[Dict[str, Any]]:
+        """Contracts still funded whose funding was recorded after funded_seq `seq`."""
+        return self._all(
+            "SELECT * FROM contracts WHERE state = ? AND funded_seq > ? ORDER BY funded_seq",
+            (STATE_FUNDED, seq),
+        )
+
+    def refundable(self, height: int) -> List[Dict[str, Any]]:
+        """Funded contracts whose CLTV refund branch is spendable at the given height."""
+        return self._all(
+            "SELECT * FROM contracts WHERE state = ? AND locktime <= ? ORDER BY locktime",
+            (STATE_FUNDED, height),
+        )
+
+    def counts(self) -> Dict[str, int]:
+        """Number of contracts in each state."""
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM contracts GROUP BY state"))
+
+    def _one(self, query: str, params: tuple) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(query, params).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def _all(self, query: str, params: tuple) -> List[Dict[str, Any]]:
+        return [dict(zip(COLUMNS, row)) for row in self.conn.execute(query, params)]
+
+def to_json(contract: Dict[str, Any]) -> Dict[str, Any]:
+    """Hex-encode the binary columns of a contract row for display."""
+    return {k: v.hex() if isinstance(v, bytes) else v for k, v in contract.items()}
+
+def hex_bytes(value: str) -> bytes:
+    """argparse type for hex arguments, so bad input is a usage error rather than a traceback."""
+    try:
+        return bytes.fromhex(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid hex: {value!r}")
+
+def outpoint(value: str) -> Tuple[bytes, int]:
+    """argparse type for a txid:vout funding outpoint."""
+    txid, sep, vout = value.partition(":")
+    if not sep or not vout.isdigit():
+        raise argparse.ArgumentTypeError(f"expected txid:vout, got {value!r}")
+    return hex_bytes(txid), int(vout)
+
+def main():
+    parser = argparse.ArgumentParser(description="ZKCP contract registry")
+    parser.add_argument("--db", default="zkcp_contracts.db", help="SQLite database path")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("add", help="Register a created contract")
+    p.add_argument("hashk", type=hex_bytes, help="SHA256 hash of encryption key (K)")
+    p.add_argument("redeem_script", type=hex_bytes, help="Redeem Script of ZKCP Script")
+    p.add_argument("locktime", type=int, help="CLTV block height")
+    p.add_argument("--seller-wallet", help="Wallet holding the seller key")
+    p.add_argument("--buyer-wallet", help="Wallet holding the buyer key")
+
+    p = sub.add_parser("fund", help="Record the funding outpoint of a contract")
+    p.add_argument("redeem_script", type=hex_bytes, help="Redeem Script of ZKCP Script")
+    p.add_argument("txid", type=hex_bytes, help="Transaction ID of Funding Script")
+    p.add_argument("vout", type=int, help="VOUT")
+    p.add_argument("amount", type=float, help="Amount locked in script")
+    p.add_argument("--buyer-wallet", help="Wallet that paid, recorded if add had none")
+
+    for command, state in SPEND_COMMANDS.items():
+        p = sub.add_parser(command, help=f"Mark a funded contract as {state}")
+        p.add_argument("redeem_script", type=hex_bytes, help="Redeem Script of ZKCP Script")
+        p.add_argument("spend_txid", type=hex_bytes, help="Transaction ID of the spending transaction")
+
+    p = sub.add_parser("show", help="Look up a contract")
+    p.add_argument("--hashk", type=hex_bytes, help="SHA256 hash of encryption key (K)")
+    p.add_argument("--redeem-script", type=hex_bytes, help="Redeem Script of ZKCP Script")
+    p.add_argument("--outpoint", type=outpoint, help="Funding outpoint as txid:vout")
+
+    p = sub.add_parser("refundable", help="List contracts refundable at a block height")
+    p.add_argument("height", type=int, help="Block height")
+
+    sub.add_parser("stats", help="Count contracts per state")
+
+    args = parser.parse_args()
+    registry = ContractRegistry(args.db)
+
+    try:
+        if args.command == "add":
+            print(registry.add(args.hashk, args.redeem_script, args.locktime,
+                               args.seller_wallet, args.buyer_wallet))
+        elif args.command == "fund":
+            sh = script_hash(args.redeem_script)
+            registry.mark_funded(sh, args.txid, args.vout, round(args.amount * 100000000), args.buyer_wallet)
+        elif args.command in SPEND_COMMANDS:
+            sh = script_hash(args.redeem_script)
+            registry.mark_spent(sh, SPEND_COMMANDS[args.command], args.spend_txid)
+        elif args.command == "show":
+            if args.hashk:
+                rows = registry.by_hashk(args.hashk)
+            elif args.redeem_script:
+                rows = [registry.by_script_hash(script_hash(args.redeem_script))]
+            elif args.outpoint:
+                rows = [registry.by_outpoint(*args.outpoint)]
+            else:
+                parser.error("show needs --hashk, --redeem-script or --outpoint")
+            print(json.dumps([to_json(r) for r in rows if r], indent=2))
+        elif args.command == "refundable":
+            print(json.dumps([to_json(r) for r in registry.refundable(args.height)], indent=2))
+        elif args.command == "stats":
+            print(json.dumps(registry.counts(), indent=2))
+    except (KeyError, InvalidTransition, sqlite3.IntegrityError) as e:
+        print(f"[!] Error: {e}")
+        sys.exit(1)
+    finally:
+        registry.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+ZKCP Regtest Nodes - Starts isolated bitcoind -regtest instances for end-to-end runs
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Optional, Sequence
+
+# Command prefix every script uses to reach the node. Defaults to the shared
+# regtest node on port 18443; RegtestNode.env() points it at an isolated one.
+BITCOIN_CLI = os.environ.get("BITCOIN_CLI", "bitcoin-cli -regtest")
+
+class RPCError(Exception):
+    """Raised by rpc() when a bitcoin-cli command exits non-zero."""
+
+def rpc(command: str) -> Dict[str, Any]:
+    """Run a Bitcoin command, raising RPCError with bitcoin-cli's message on failure."""
+    result = subprocess.run(
+        command, shell=True, text=True, capture_output=True
+    )
+    if result.returncode != 0:
+        raise RPCError(result.stderr.strip())
+    try:
+        return json.loads(result.stdout)
+    except json.JSONDecodeError:
+        return {"result": result.stdout.strip()}
+
+def run_command(command: str) -> Dict[str, Any]:
+    """Run a Bitcoin command and return the result as a dictionary, exiting on failure."""
+    try:
+        return rpc(command)
+    except RPCError as e:
+        print(f"Error running command: {command}")
+        print(f"Error: {e}")
+        sys.exit(1)
+
+def free_port() -> int:
+    """Ask the OS for a currently unused TCP port."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class RegtestNode:
+    """A bitcoind -regtest with its own temporary datadir and RPC port.
+
+    Use as a context manager so the daemon is stopped and its datadir
+    removed even when a run fails.
+    """
+
+    def __init__(self, bitcoind: str = "bitcoind", cli: str = "bitcoin-cli",
+                 extra_args: Sequence[str] = ()):
+        self.bitcoind = bitcoind
+        self.cli = cli
+        self.extra_args = list(extra_args)
+        self.datadir: Optional[str] = None
+        self.rpcport: Optional[int] = None
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def cli_command(self) -> str:
+        return f"{self.cli} -regtest -datadir={self.datadir} -rpcport={self.rpcport}"
+
+    def env(self) -> Dict[str, str]:
+        """Environment that makes the ZKCP scripts talk to this node."""
+        return dict(os.environ, BITCOIN_CLI=self.cli_command)
+
+    def start(self, timeout: float = 30.0) -> "RegtestNode":
+        self.datadir = tempfile.mkdtemp(prefix="zkcp-regtest-")
+        self.rpcport = free_port()
+        try:
+            self.process = subprocess.Popen(
+                [self.bitcoind, "-regtest", f"-datadir={self.datadir}", f"-rpcport={self.rpcport}",
+                 "-listen=0", "-rpcbind=127.0.0.1", "-rpcallowip=127.0.0.1",
+                 "-fallbackfee=0.0001", "-deprecatedrpc=create_bdb", *self.extra_args],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+        except OSError:
+            self.stop()
+            raise
+        deadline = time.monotonic() + timeout
+        while True:
+            result = subprocess.run(f"{self.cli_command} getblockcount", shell=True,
+                                    text=True, capture_output=True)
+            if result.returncode == 0:
+                return self
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError(f"bitcoind did not start: {result.stderr.strip()}")
+            time.sleep(0.2)
+
+    def call(self, *args: str) -> Any:
+        """Run one bitcoin-cli command against this node, decoding JSON results."""
+        result = subprocess.run(f"{self.cli_command} {' '.join(args)}", shell=True,
+                                text=True, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(args)}: {result.stderr.strip()}")
+        try:
+            return json.loads(result.stdout)
+        except json.JSONDecodeError:
+            return result.stdout.strip()
+
+    def stop(self) -> None:
+        if self.process is not None:
+            subprocess.run(f"{self.cli_command} stop", shell=True, capture_output=True)
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+        if self.datadir is not None:
+            shutil.rmtree(self.datadir, ignore_errors=True)
+            self.datadir = None
+
+    def __enter__(self) -> "RegtestNode":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an isolated regtest node until interrupted")
+    parser.add_argument("--bitcoind", default="bitcoind", help="bitcoind binary")
+    parser.add_argument("--cli", default="bitcoin-cli", help="bitcoin-cli binary")
+
+    args = parser.parse_args()
+
+    with RegtestNode(args.bitcoind, args.cli) as node:
+        print(f"[*] Node running in {node.datadir}")
+        print(f"export BITCOIN_CLI=\"{node.cli_command}\"")
+        try:
+            while node.process.poll() is None:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("\n[*] Stopping node")
+
+if __name__ == "__main__":
+    main()
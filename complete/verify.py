@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+ZKCP Script Verifier - Checks claim and refund scriptSigs locally before broadcasting
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+from bitcoin.core import x, CScript, CTransaction
+from bitcoin.core.script import (
+    IsLowDERSignature, OP_0, OP_1, OP_1NEGATE, OP_CHECKLOCKTIMEVERIFY,
+    OP_PUSHDATA1, OP_PUSHDATA2, SIGHASH_ANYONECANPAY
+)
+from bitcoin.core.scripteval import (
+    VerifyScript, VerifyScriptError,
+    SCRIPT_VERIFY_CLEANSTACK, SCRIPT_VERIFY_DERSIG, SCRIPT_VERIFY_LOW_S,
+    SCRIPT_VERIFY_MINIMALDATA, SCRIPT_VERIFY_P2SH, SCRIPT_VERIFY_STRICTENC
+)
+
+# The standardness flags a node relays with. python-bitcoinlib only enforces
+# P2SH and CLEANSTACK itself, so the signature and push encoding rules are
+# checked in check_encoding()
+STANDARD_FLAGS = (
+    SCRIPT_VERIFY_P2SH, SCRIPT_VERIFY_DERSIG, SCRIPT_VERIFY_LOW_S,
+    SCRIPT_VERIFY_STRICTENC, SCRIPT_VERIFY_MINIMALDATA, SCRIPT_VERIFY_CLEANSTACK,
+)
+
+# python-bitcoinlib evaluates OP_CHECKLOCKTIMEVERIFY as a NOP, so the
+# refund branch's locktime is checked separately in check_locktime()
+FINAL_SEQUENCE = 0xffffffff
+
+# nLockTime and CLTV operands below this are block heights, above it timestamps
+LOCKTIME_THRESHOLD = 500000000
+
+# Positions of hashk and the CLTV height in the complete/asm.py redeem script
+HASHK_INDEX = 1
+LOCKTIME_INDEX = 6
+
+def script_int(element) -> int:
+    """Decode a pushed script number (small ints come back from CScript as ints)."""
+    if isinstance(element, int):
+        return element
+    return int.from_bytes(element, "little")
+
+def is_der_signature(sig: bytes) -> bool:
+    """BIP66 strict DER encoding of a signature with its trailing sighash byte."""
+    if len(sig) < 9 or len(sig) > 73:
+        return False
+    if sig[0] != 0x30 or sig[1] != len(sig) - 3:
+        return False
+    len_r = sig[3]
+    if 5 + len_r >= len(sig):
+        return False
+    len_s = sig[5 + len_r]
+    if len_r + len_s + 7 != len(sig):
+        return False
+    # R and S must be positive integers without excess leading zeros
+    if sig[2] != 0x02 or len_r == 0 or sig[4] & 0x80:
+        return False
+    if len_r > 1 and sig[4] == 0 and not sig[5] & 0x80:
+        return False
+    if sig[len_r + 4] != 0x02 or len_s == 0 or sig[len_r + 6] & 0x80:
+        return False
+    if len_s > 1 and sig[len_r + 6] == 0 and not sig[len_r + 7] & 0x80:
+        return False
+    return True
+
+def is_minimal_push(opcode: int, data: bytes) -> bool:
+    """Whether data is pushed with the shortest opcode, as MINIMALDATA requires."""
+    if len(data) == 0:
+        return opcode == OP_0
+    if len(data) == 1 and 1 <= data[0] <= 16:
+        return opcode == OP_1 + data[0] - 1
+    if len(data) == 1 and data[0] == 0x81:
+        return opcode == OP_1NEGATE
+    if len(data) < OP_PUSHDATA1:
+        return opcode == len(data)
+    if len(data) <= 0xff:
+        return opcode == OP_PUSHDATA1
+    if len(data) <= 0xffff:
+        return opcode == OP_PUSHDATA2
+    return True
+
+def check_encoding(script_sig: CScript, redeem_script: CScript) -> None:
+    """Enforce DERSIG, LOW_S, STRICTENC (sighash type) and MINIMALDATA on a claim or refund."""
+    for script in (script_sig, redeem_script):
+        for opcode, data, _ in script.raw_iter():
+            if data is not None and not is_minimal_push(opcode, data):
+                raise VerifyScriptError(f"Non-minimal push of {len(data)} bytes")
+    # Both branches take the signature as the first scriptSig push
+    sig = list(script_sig)[0]
+    if not isinstance(sig, bytes) or not is_der_signature(sig):
+        raise VerifyScriptError("Signature is not strict DER")
+    if sig[-1] & ~SIGHASH_ANYONECANPAY not in (1, 2, 3):
+        raise VerifyScriptError(f"Undefined sighash type {sig[-1]:#x}")
+    if not IsLowDERSignature(sig[:-1]):
+        raise VerifyScriptError("Signature S value is not low")
+
+def check_locktime(tx: CTransaction, redeem_script: CScript, index: int = 0) -> None:
+    """Enforce the CLTV rules for a spend that takes the ELSE branch."""
+    elements = list(redeem_script)
+    if OP_CHECKLOCKTIMEVERIFY not in elements:
+        return
+    preimage = list(tx.vin[index].scriptSig)[-2]
+    # An empty push (OP_0) comes back as an int and never matches hashk
+    if isinstance(preimage, bytes) and hashlib.sha256(preimage).digest() == elements[HASHK_INDEX]:
+        return
+    locktime = script_int(elements[LOCKTIME_INDEX])
+    if tx.vin[index].nSequence == FINAL_SEQUENCE:
+        raise VerifyScriptError("CLTV refund input has a final nSequence")
+    if (tx.nLockTime < LOCKTIME_THRESHOLD) != (locktime < LOCKTIME_THRESHOLD):
+        raise VerifyScriptError(f"nLockTime {tx.nLockTime} and CLTV operand {locktime} mix a height and a time")
+    if tx.nLockTime < locktime:
+        raise VerifyScriptError(f"nLockTime {tx.nLockTime} is below the CLTV height {locktime}")
+
+def verify_spend(tx: CTransaction, redeem_script: CScript, index: int = 0) -> None:
+    """Raise VerifyScriptError unless the input spends the P2SH output of redeem_script."""
+    script_sig = tx.vin[index].scriptSig
+    VerifyScript(script_sig, redeem_script.to_p2sh_scriptPubKey(), tx, index, STANDARD_FLAGS)
+    check_encoding(script_sig, redeem_script)
+    check_locktime(tx, redeem_script, index)
+
+def _verify_serialized(item: Tuple[bytes, bytes]) -> Optional[str]:
+    """Process pool worker: returns None if valid, otherwise the error message."""
+    tx_bytes, redeem_script = item
+    try:
+        verify_spend(CTransaction.deserialize(tx_bytes), CScript(redeem_script))
+    except Exception as e:
+        return str(e)
+    return None
+
+def verify_batch(items: Iterable[Tuple[bytes, bytes]], workers: Optional[int] = None) -> List[Optional[str]]:
+    """Verify (serialized tx, redeem script) pairs across a process pool, preserving order."""
+    items = list(items)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(items) < 2:
+        return [_verify_serialized(item) for item in items]
+    chunksize = max(len(items) // (workers * 4), 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_verify_serialized, items, chunksize=chunksize))
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify ZKCP spends locally")
+    parser.add_argument("batch", help="File with one '<tx hex> <redeem script hex>' pair per line, - for stdin")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+
+    args = parser.parse_args()
+
+    if args.batch == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(args.batch) as f:
+            lines = f.readlines()
+    items = [tuple(x(field) for field in line.split()) for line in lines if line.strip()]
+    errors = verify_batch(items, args.workers)
+
+    failed = [{"line": i + 1, "error": error} for i, error in enumerate(errors) if error]
+    print(json.dumps({"verified": len(items) - len(failed), "failed": failed}, indent=2))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
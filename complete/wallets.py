@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+ZKCP Wallet Pools - Spreads each role's wallet RPCs across several bitcoind wallets
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+from typing import List, Optional
+from regtest import BITCOIN_CLI
+
+ROUTINGS = ("round-robin", "hash")
+
+class WalletPool:
+    """Wallets serving one role (seller or buyer).
+
+    bitcoind serializes calls on a single wallet, so concurrent fundings,
+    claims and address requests are routed across the pool. With "hash"
+    routing a contract always maps to the same wallet, so its keys can be
+    found again later; "round-robin" spreads calls that have no contract yet.
+    Keys for a new contract come from a round-robin pick and the wallet is
+    recorded in the registry, since there is no script hash to route on yet.
+    """
+
+    def __init__(self, names: List[str], routing: str = "hash"):
+        if not names:
+            raise ValueError("A wallet pool needs at least one wallet")
+        if routing not in ROUTINGS:
+            raise ValueError(f"Unknown routing {routing!r}, expected one of {ROUTINGS}")
+        self.names = list(names)
+        self.routing = routing
+        self.lock = threading.Lock()
+        # Each process starts at a random wallet, so one-shot scripts still spread out
+        start = random.randrange(len(self.names))
+        self.cycle = itertools.cycle(self.names[start:] + self.names[:start])
+
+    @classmethod
+    def from_env(cls, role: str) -> "WalletPool":
+        """Pool from ZKCP_<ROLE>_WALLETS (comma separated) and ZKCP_WALLET_ROUTING.
+
+        Defaults to the single `<role>wallet` used by the shell scripts.
+        """
+        names = os.environ.get(f"ZKCP_{role.upper()}_WALLETS", f"{role}wallet").split(",")
+        return cls([name.strip() for name in names if name.strip()],
+                   os.environ.get("ZKCP_WALLET_ROUTING", "hash"))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def pick(self, key: Optional[bytes] = None) -> str:
+        """Wallet for a contract key (e.g. its script hash), or the next one in turn."""
+        if self.routing == "hash" and key is not None:
+            return self.names[int.from_bytes(hashlib.sha256(key).digest()[:8], "big") % len(self.names)]
+        with self.lock:
+            return next(self.cycle)
+
+    def owner(self, address: str) -> str:
+        """Wallet in the pool whose keys control the address."""
+        for name in self.names:
+            result = subprocess.run(f"{BITCOIN_CLI} -rpcwallet={name} getaddressinfo {address}",
+                                    shell=True, text=True, capture_output=True)
+            if result.returncode == 0 and json.loads(result.stdout).get("ismine"):
+                return name
+        raise KeyError(f"No wallet in {self.names} owns {address}")
+
+    def ensure(self) -> List[str]:
+        """Load or create any wallets in the pool that are not loaded, returning the created names."""
+        result = subprocess.run(f"{BITCOIN_CLI} listwallets", shell=True,
+                                text=True, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"listwallets failed: {result.stderr.strip()}")
+        loaded = json.loads(result.stdout)
+        created = []
+        for name in self.names:
+            if name in loaded:
+                continue
+            # Wallets from an earlier run are on disk but not loaded after a restart
+            result = subprocess.run(f'{BITCOIN_CLI} loadwallet "{name}"',
+                                    shell=True, text=True, capture_output=True)
+            if result.returncode == 0:
+                continue
+            # Legacy wallets, matching the shell scripts, so dumpprivkey keeps working
+            result = subprocess.run(f'{BITCOIN_CLI} createwallet "{name}" false false "" false false',
+                                    shell=True, text=True, capture_output=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"Could not create wallet {name}: {result.stderr.strip()}")
+            created.append(name)
+        return created
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the wallets of the seller and buyer pools")
+    parser.add_argument("--seller", help="Comma separated seller wallets (default: ZKCP_SELLER_WALLETS)")
+    parser.add_argument("--buyer", help="Comma separated buyer wallets (default: ZKCP_BUYER_WALLETS)")
+    parser.add_argument("--pick", choices=("seller", "buyer"), help="Only print the wallet to take a new contract's key from")
+
+    args = parser.parse_args()
+
+    pools = {
+        role: WalletPool(names.split(",")) if names else WalletPool.from_env(role)
+        for role, names in (("seller", args.seller), ("buyer", args.buyer))
+    }
+    if args.pick:
+        print(pools[args.pick].pick())
+        return
+    for role, pool in pools.items():
+        try:
+            created = pool.ensure()
+        except RuntimeError as e:
+            print(f"[!] {e}")
+            sys.exit(1)
+        print(f"[*] {role.capitalize()} wallets: {', '.join(pool.names)} ({len(created)} created)")
+
+if __name__ == "__main__":
+    main()
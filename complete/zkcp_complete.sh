@@ -11,45 +11,46 @@ if ! python3 -c "import bitcoin" &>/dev/null; then
     pip3 install python-bitcoinlib
 fi
 
+# Same node prefix as the Python scripts (complete/regtest.py)
+BITCOIN_CLI="${BITCOIN_CLI:-bitcoin-cli -regtest}"
+
 # 1. Start Bitcoin Daemon if not running
-if ! bitcoin-cli -regtest getblockcount &>/dev/null; then
+if ! $BITCOIN_CLI getblockcount &>/dev/null; then
     echo "[*] Starting Bitcoin Daemon..."
     bitcoind -regtest -fallbackfee=0.0001 -daemon -deprecatedrpc=create_bdb
     sleep 3
 fi
 
-# 2. Create wallets if they don't exist
-WALLETS=$(bitcoin-cli -regtest listwallets)
-if ! echo $WALLETS | grep -q "sellerwallet"; then
-    echo "[*] Creating seller wallet..."
-    bitcoin-cli -regtest createwallet "sellerwallet" false false "" false false > /dev/null 2>&1
-fi
+# 2. Create the seller and buyer wallet pools if they don't exist
+# (ZKCP_SELLER_WALLETS / ZKCP_BUYER_WALLETS, default sellerwallet / buyerwallet)
+python3 wallets.py
 
-if ! echo $WALLETS | grep -q "buyerwallet"; then
-    echo "[*] Creating buyer wallet..."
-    bitcoin-cli -regtest createwallet "buyerwallet" false false "" false false > /dev/null 2>&1
-fi
+# Take this contract's keys from one wallet of each pool; the registry remembers which
+SELLER_WALLET=$(python3 wallets.py --pick seller)
+BUYER_WALLET=$(python3 wallets.py --pick buyer)
+echo "[*] Seller wallet: $SELLER_WALLET"
+echo "[*] Buyer wallet: $BUYER_WALLET"
 
 # 3. Get addresses
-seller_address=$(bitcoin-cli -regtest -rpcwallet=sellerwallet getnewaddress) 
-buyer_address=$(bitcoin-cli -regtest -rpcwallet=buyerwallet getnewaddress)
+seller_address=$($BITCOIN_CLI -rpcwallet=$SELLER_WALLET getnewaddress) 
+buyer_address=$($BITCOIN_CLI -rpcwallet=$BUYER_WALLET getnewaddress)
 echo "[*] Seller address: $seller_address"
 echo "[*] Buyer address: $buyer_address"
 
 # 4. Fund the wallets if needed
 echo "[*] Initial wallet balances:"
-echo "    Seller: $(bitcoin-cli -regtest -rpcwallet=sellerwallet getreceivedbyaddress $seller_address) BTC"
-echo "    Buyer: $(bitcoin-cli -regtest -rpcwallet=buyerwallet getreceivedbyaddress $buyer_address) BTC"
+echo "    Seller: $($BITCOIN_CLI -rpcwallet=$SELLER_WALLET getreceivedbyaddress $seller_address) BTC"
+echo "    Buyer: $($BITCOIN_CLI -rpcwallet=$BUYER_WALLET getreceivedbyaddress $buyer_address) BTC"
 
 echo "[*] Mining blocks to fund seller wallet..."
-bitcoin-cli -regtest generatetoaddress 101 $seller_address > /dev/null 2>&1
+$BITCOIN_CLI generatetoaddress 101 $seller_address > /dev/null 2>&1
 
 echo "[*] Mining blocks to fund buyer wallet..."
-bitcoin-cli -regtest generatetoaddress 101 $buyer_address > /dev/null 2>&1
+$BITCOIN_CLI generatetoaddress 101 $buyer_address > /dev/null 2>&1
 
 echo "[*] Wallet balances after funding:"
-echo "    Seller: $(bitcoin-cli -regtest -rpcwallet=sellerwallet getreceivedbyaddress $seller_address) BTC"
-echo "    Buyer: $(bitcoin-cli -regtest -rpcwallet=buyerwallet getreceivedbyaddress $buyer_address) BTC"
+echo "    Seller: $($BITCOIN_CLI -rpcwallet=$SELLER_WALLET getreceivedbyaddress $seller_address) BTC"
+echo "    Buyer: $($BITCOIN_CLI -rpcwallet=$BUYER_WALLET getreceivedbyaddress $buyer_address) BTC"
 
 # 5. Generate the redeem script using asm.py to prepare for funding
 echo -e "\n========== ZKCP SETUP PHASE ==========\n"
@@ -57,7 +58,7 @@ echo -e "\n========== ZKCP SETUP PHASE ==========\n"
 # Setup parameters
 REAL_K="HELLO"
 HASH_K=$(python3 ../common/hash.py $REAL_K)
-BLOCK_HEIGHT=$(bitcoin-cli -regtest getblockcount)
+BLOCK_HEIGHT=$($BITCOIN_CLI getblockcount)
 LOCKTIME=$((BLOCK_HEIGHT + 100))
 
 echo "[*] Seller computes parameters:"
@@ -66,45 +67,52 @@ echo "    Y = SHA256(K): $HASH_K"
 echo "    Locktime: $LOCKTIME (refund after this block)"
 
 # Get public keys
-seller_pubkey=$(bitcoin-cli -regtest -rpcwallet=sellerwallet getaddressinfo $seller_address | jq -r .pubkey)
-buyer_pubkey=$(bitcoin-cli -regtest -rpcwallet=buyerwallet getaddressinfo $buyer_address | jq -r .pubkey)
+seller_pubkey=$($BITCOIN_CLI -rpcwallet=$SELLER_WALLET getaddressinfo $seller_address | jq -r .pubkey)
+buyer_pubkey=$($BITCOIN_CLI -rpcwallet=$BUYER_WALLET getaddressinfo $buyer_address | jq -r .pubkey)
 
 # Generate redeem script using Python script
 echo "[*] Generating redeem script..."
 REDEEM_SCRIPT=$(python3 asm.py "$HASH_K" "$seller_pubkey" "$LOCKTIME" "$buyer_pubkey")
 
 # Decode script to get P2SH address
-SCRIPT_INFO=$(bitcoin-cli -regtest decodescript "$REDEEM_SCRIPT")
+SCRIPT_INFO=$($BITCOIN_CLI decodescript "$REDEEM_SCRIPT")
 P2SH_ADDRESS=$(echo "$SCRIPT_INFO" | jq -r .p2sh)
 echo "[*] P2SH Address: $P2SH_ADDRESS"
 
+# Register the contract so its state survives this run
+REGISTRY_DB="zkcp_contracts.db"
+python3 registry.py --db "$REGISTRY_DB" add "$HASH_K" "$REDEEM_SCRIPT" "$LOCKTIME" \
+    --seller-wallet "$SELLER_WALLET" --buyer-wallet "$BUYER_WALLET" > /dev/null
+echo "[*] Contract registered in $REGISTRY_DB"
+
 # 6. Buyer funds the P2SH address
 echo -e "\n========== PAYMENT SETUP PHASE ==========\n"
 echo "[*] Buyer verifies parameters and funds P2SH address..."
-TXID=$(bitcoin-cli -regtest -rpcwallet=buyerwallet sendtoaddress "$P2SH_ADDRESS" 1.0)
+TXID=$($BITCOIN_CLI -rpcwallet=$BUYER_WALLET sendtoaddress "$P2SH_ADDRESS" 1.0)
 echo "[*] Funding transaction sent: $TXID"
 
 # 7. Check if Transaction Exists
-CHECK_TXID=$(bitcoin-cli -regtest -rpcwallet=buyerwallet gettransaction $TXID | jq -r .txid)
+CHECK_TXID=$($BITCOIN_CLI -rpcwallet=$BUYER_WALLET gettransaction $TXID | jq -r .txid)
 echo "[*] Transaction $CHECK_TXID on Buyer Wallet"
 
 # 8. Import script to wallets for tracking
 echo "[*] Importing scripts to wallets..."
-bitcoin-cli -regtest -rpcwallet=buyerwallet importaddress "$REDEEM_SCRIPT" "zkcp_redeem" false > /dev/null 2>&1
-bitcoin-cli -regtest -rpcwallet=buyerwallet importaddress "$P2SH_ADDRESS" "zkcp_p2sh" false > /dev/null 2>&1
-bitcoin-cli -regtest -rpcwallet=sellerwallet importaddress "$REDEEM_SCRIPT" "zkcp_redeem" false > /dev/null 2>&1
-bitcoin-cli -regtest -rpcwallet=sellerwallet importaddress "$P2SH_ADDRESS" "zkcp_p2sh" false > /dev/null 2>&1
+$BITCOIN_CLI -rpcwallet=$BUYER_WALLET importaddress "$REDEEM_SCRIPT" "zkcp_redeem" false > /dev/null 2>&1
+$BITCOIN_CLI -rpcwallet=$BUYER_WALLET importaddress "$P2SH_ADDRESS" "zkcp_p2sh" false > /dev/null 2>&1
+$BITCOIN_CLI -rpcwallet=$SELLER_WALLET importaddress "$REDEEM_SCRIPT" "zkcp_redeem" false > /dev/null 2>&1
+$BITCOIN_CLI -rpcwallet=$SELLER_WALLET importaddress "$P2SH_ADDRESS" "zkcp_p2sh" false > /dev/null 2>&1
 
 # 9. Mine blocks to confirm funding transaction
 echo "[*] Mining blocks to confirm funding transaction..."
-bitcoin-cli -regtest generatetoaddress 6 $buyer_address > /dev/null 2>&1
+$BITCOIN_CLI generatetoaddress 6 $buyer_address > /dev/null 2>&1
 echo "[*] Funding transaction confirmed"
 
 # 10. Find the P2SH UTXO
-UTXO_TXID=$(bitcoin-cli -rpcwallet=buyerwallet -regtest listunspent 0 9999999 "[\"$P2SH_ADDRESS\"]" | jq -r .[0].txid)
-VOUT=$(bitcoin-cli -rpcwallet=buyerwallet -regtest listunspent 0 9999999 "[\"$P2SH_ADDRESS\"]" | jq -r .[0].vout)
-AMOUNT=$(bitcoin-cli -rpcwallet=buyerwallet -regtest listunspent 0 9999999 "[\"$P2SH_ADDRESS\"]" | jq -r .[0].amount)
+UTXO_TXID=$($BITCOIN_CLI -rpcwallet=$BUYER_WALLET listunspent 0 9999999 "[\"$P2SH_ADDRESS\"]" | jq -r .[0].txid)
+VOUT=$($BITCOIN_CLI -rpcwallet=$BUYER_WALLET listunspent 0 9999999 "[\"$P2SH_ADDRESS\"]" | jq -r .[0].vout)
+AMOUNT=$($BITCOIN_CLI -rpcwallet=$BUYER_WALLET listunspent 0 9999999 "[\"$P2SH_ADDRESS\"]" | jq -r .[0].amount)
 echo "[*] Found UTXO: $UTXO_TXID:$VOUT with $AMOUNT BTC"
+python3 registry.py --db "$REGISTRY_DB" fund "$REDEEM_SCRIPT" "$UTXO_TXID" "$VOUT" $AMOUNT
 
 # 11. Use the specialized Python script to create and broadcast transaction with proper scriptSig
 echo -e "\n========== PAYMENT EXECUTION PHASE ==========\n"
@@ -112,11 +120,11 @@ echo "[*] Seller creates and broadcasts transaction revealing K..."
 echo "[*] Running specialized Python script to create proper scriptSig..."
 
 # Execute the Python script (zkcp_complete_tx.py) that creates the proper scriptSig
-python3 zkcp_complete_tx.py "$REAL_K" "$LOCKTIME" "$REDEEM_SCRIPT" "$TXID" "$VOUT" $AMOUNT
+python3 zkcp_complete_tx.py "$REAL_K" "$LOCKTIME" "$REDEEM_SCRIPT" "$TXID" "$VOUT" $AMOUNT --registry "$REGISTRY_DB"
 
 # Mine some blocks to confirm
 echo "[*] Mining blocks to confirm transaction..."
-bitcoin-cli -regtest generatetoaddress 6 $seller_address > /dev/null 2>&1
+$BITCOIN_CLI generatetoaddress 6 $seller_address > /dev/null 2>&1
 echo "[*] Transaction confirmed!"
 
 # 10. Verify transaction confirmation and extraction of K
@@ -138,7 +146,7 @@ fi
 
 echo -e "\n========== FINAL BALANCES ==========\n"
 echo "[*] Wallet balances after ZKCP:"
-echo "    Seller: $(bitcoin-cli -regtest -rpcwallet=sellerwallet getbalance) BTC"
-echo "    Buyer: $(bitcoin-cli -regtest -rpcwallet=buyerwallet getbalance) BTC"
+echo "    Seller: $($BITCOIN_CLI -rpcwallet=$SELLER_WALLET getbalance) BTC"
+echo "    Buyer: $($BITCOIN_CLI -rpcwallet=$BUYER_WALLET getbalance) BTC"
 
 echo -e "\n[*] ZKCP demonstration complete"
@@ -4,12 +4,15 @@ ZKCP Transaction Builder - Creates a proper scriptSig to reveal K and spend from
 """
 
 import argparse
+import math
+import os
 import sys
 import json
 import subprocess
-from typing import Dict, Any, Tuple
+import time
+from typing import Dict, Any
 from bitcoin.core import (
-    x, b2x, lx, CMutableTransaction, 
+    x, b2x, b2lx, lx, CMutableTransaction,
     CMutableTxIn, CMutableTxOut, COutPoint, CScript
 )
 from bitcoin.core.script import (
@@ -18,130 +21,236 @@ from bitcoin.core.script import (
 )
 from bitcoin.wallet import CBitcoinSecret, P2PKHBitcoinAddress
 import bitcoin.rpc
+from registry import ContractRegistry, script_hash, STATE_CLAIMED
+from regtest import BITCOIN_CLI, rpc, run_command, RPCError
+from verify import verify_spend
+from wallets import WalletPool
 
 # Initialize Bitcoin Regtest connection
 bitcoin.SelectParams('regtest')
 rpc_connection = bitcoin.rpc.Proxy("http://localhost:18443")
 
-def run_command(command: str) -> Dict[str, Any]:
-    """Run a Bitcoin command and return the result as a dictionary."""
-    result = subprocess.run(
-        command, shell=True, text=True, capture_output=True
-    )
-    if result.returncode != 0:
-        print(f"Error running command: {command}")
-        print(f"Error: {result.stderr}")
-        sys.exit(1)
-    try:
-        return json.loads(result.stdout)
-    except json.JSONDecodeError:
-        return {"result": result.stdout.strip()}
+# Position of the seller pubkey in the complete/asm.py redeem script
+SELLER_PUBKEY_INDEX = 4
+
+# nSequence below 0xfffffffe signals BIP125 replaceability
+RBF_SEQUENCE = 0xfffffffd
+
+# Fee rate (sat/vB) used when estimatesmartfee has no data, matches -fallbackfee=0.0001
+FALLBACK_FEE_RATE = 10.0
 
-def get_wallet_info(wallet_name: str) -> Tuple[str, str, str]:
-    """Get address, private key, and public key from wallet."""
-    address = run_command(f"bitcoin-cli -regtest -rpcwallet={wallet_name} getnewaddress")["result"]
-    privkey = run_command(f"bitcoin-cli -regtest -rpcwallet={wallet_name} dumpprivkey {address}")["result"]
-    pubkey = run_command(f"bitcoin-cli -regtest -rpcwallet={wallet_name} getaddressinfo {address}")["pubkey"]
-    return address, privkey, pubkey
+# Bitcoin Core's default -incrementalrelayfee (sat/vB)
+INCREMENTAL_RELAY_FEE = 1.0
 
 def get_p2sh_utxo(p2sh_address: str) -> Dict[str, Any]:
     """Find an unspent output for the P2SH address."""
-    unspent = run_command(f'bitcoin-cli -regtest listunspent 0 9999999 "[\"{p2sh_address}\"]"')
+    unspent = run_command(f'{BITCOIN_CLI} listunspent 0 9999999 "[\"{p2sh_address}\"]"')
     if not unspent or len(unspent) == 0:
         print(f"No unspent outputs found for {p2sh_address}")
         sys.exit(1)
     return unspent[0]
 
+def estimate_fee_rate(conf_target: int) -> float:
+    """Fee rate in sat/vB for confirmation within conf_target blocks."""
+    estimate = run_command(f"{BITCOIN_CLI} estimatesmartfee {max(conf_target, 1)}")
+    if "feerate" not in estimate:
+        return FALLBACK_FEE_RATE
+    # estimatesmartfee reports BTC/kvB
+    return estimate["feerate"] * 100000
+
+def bump_fee_rate(old_rate: float, conf_target: int) -> float:
+    """Fee rate for a replacement, which must pay more than the original (BIP125 rules 3 and 4)."""
+    return max(old_rate * 1.25, old_rate + INCREMENTAL_RELAY_FEE, estimate_fee_rate(conf_target))
+
+def build_claim_tx(redeem_script: CScript, txid: str, vout: int, amount: int, real_k: bytes,
+                   seller_key: CBitcoinSecret, script_pub_key: CScript, fee: int) -> CMutableTransaction:
+    """Build and sign a replaceable spend of the IF branch revealing K, amounts in satoshis."""
+    txin = CMutableTxIn(COutPoint(lx(txid), vout), nSequence=RBF_SEQUENCE)
+    txout = CMutableTxOut(amount - fee, script_pub_key)
+    tx = CMutableTransaction([txin], [txout])
+
+    # Create the signature hash for signing
+    sighash = SignatureHash(redeem_script, tx, 0, SIGHASH_ALL)
+
+    # Sign with seller's private key
+    sig = seller_key.sign(sighash) + bytes([SIGHASH_ALL])
+
+    # Create the proper scriptSig that reveals K and takes the IF branch
+    # The scriptSig structure for the IF branch is:
+    # <signature> <K> <redeemScript>
+    # SHA256(K) == hashk selects the IF branch, so no extra TRUE is pushed
+    tx.vin[0].scriptSig = CScript([
+        sig,           # Seller's signature
+        real_k,        # Reveal K (the decryption key)
+        redeem_script  # The complete redeem script
+    ])
+    return tx
+
+def build_claim_at_rate(redeem_script: CScript, txid: str, vout: int, amount: int, real_k: bytes,
+                        seller_key: CBitcoinSecret, script_pub_key: CScript,
+                        fee_rate: float) -> CMutableTransaction:
+    """Build a claim paying fee_rate sat/vB, sized from a first signed draft."""
+    draft = build_claim_tx(redeem_script, txid, vout, amount, real_k, seller_key, script_pub_key, 0)
+    # +1 byte covers a longer DER signature on the final signing
+    fee = math.ceil((len(draft.serialize()) + 1) * fee_rate)
+    return build_claim_tx(redeem_script, txid, vout, amount, real_k, seller_key, script_pub_key, fee)
+
+def get_confirmations(txid: str, wallet_name: str) -> int:
+    """Confirmations of a transaction paying into the given wallet."""
+    result = subprocess.run(
+        f"{BITCOIN_CLI} -rpcwallet={wallet_name} gettransaction {txid}",
+        shell=True, text=True, capture_output=True
+    )
+    if result.returncode != 0:
+        return 0
+    return json.loads(result.stdout).get("confirmations", 0)
+
 def main():
     parser = argparse.ArgumentParser(description="Generate Bitcoin redeem script")
     parser.add_argument("real_k", help="Real Key")
-    parser.add_argument("locktime", type=int, help="Lock time")
+    parser.add_argument("locktime", type=int, help="CLTV block height, the claim must confirm before it")
     parser.add_argument("redeem_script", help="Redeem Script of ZKCP Script")
     parser.add_argument("txid", help="Transaction ID of Funding Script")
     parser.add_argument("vout", type=int, help="VOUT")
     parser.add_argument("amount", type=float, help="Amount locked in script")
+    parser.add_argument("--registry", help="Contract registry database to record the claim in")
+    parser.add_argument("--fee-rate", type=float, help="Fee rate in sat/vB instead of estimatesmartfee")
+    parser.add_argument("--conf-target", type=int, default=6, help="Blocks to confirm within before bumping the fee")
+    parser.add_argument("--watch", action="store_true", help="Wait for confirmation and bump the fee instead of mining")
 
     args = parser.parse_args()
 
-    # 1. Setup - Get existing wallet info or create new ones
+    redeem_script = CScript(x(args.redeem_script))
+
+    # 1. Setup - Find the seller wallet holding the key committed to in the script
     print("[*] Getting wallet information...")
     try:
-        seller_address, seller_privkey, _ = get_wallet_info("sellerwallet")
-        buyer_address, _, _ = get_wallet_info("buyerwallet")
+        seller_address = P2PKHBitcoinAddress.from_pubkey(list(redeem_script)[SELLER_PUBKEY_INDEX])
+        seller_wallet = None
+        if args.registry:
+            registry = ContractRegistry(args.registry)
+            contract = registry.by_script_hash(script_hash(redeem_script))
+            registry.close()
+            seller_wallet = contract["seller_wallet"] if contract else None
+        if not seller_wallet:
+            seller_wallet = WalletPool.from_env("seller").owner(seller_address)
+        seller_privkey = run_command(f"{BITCOIN_CLI} -rpcwallet={seller_wallet} dumpprivkey {seller_address}")["result"]
+        print(f"  Seller wallet: {seller_wallet}")
         print(f"  Seller address: {seller_address}")
-        print(f"  Buyer address: {buyer_address}")
     except Exception as e:
         print(f"Error getting wallet info: {e}")
         print("Make sure Bitcoin daemon is running and wallets are created")
         sys.exit(1)
 
-    # 2. Create transaction spending from P2SH to seller's address
-    fee = 0.0001
-    output_amount = args.amount - fee
-
-    # 2.1 Other Setups
+    # 2. Other Setups
     seller_key = CBitcoinSecret(seller_privkey)
-    seller_pubkey = seller_key.pub
-    seller_address = P2PKHBitcoinAddress.from_pubkey(seller_pubkey)
     script_pub_key = seller_address.to_scriptPubKey()
-    redeem_script = CScript(x(args.redeem_script))
-    
-    # 3. Create the raw transaction
-    txin = CMutableTxIn(COutPoint(lx(args.txid), args.vout))
-    txout = CMutableTxOut(int(output_amount * 100000000), script_pub_key)
-    tx = CMutableTransaction([txin], [txout])
+    amount = round(args.amount * 100000000)
+    real_k = args.real_k.encode()
 
-    tx.nLockTime = args.locktime
-    txin.nSequence = 0xfffffffe
+    # 3. Pick a fee rate from the configured policy or the node's estimate
+    height = run_command(f"{BITCOIN_CLI} getblockchaininfo")["blocks"]
+    conf_target = min(args.conf_target, args.locktime - height)
+    fee_rate = args.fee_rate if args.fee_rate else estimate_fee_rate(conf_target)
+    print(f"[*] Fee rate: {fee_rate:.2f} sat/vB")
 
-    # 4. Create the signature hash for signing
-    sighash = SignatureHash(redeem_script, tx, 0, SIGHASH_ALL)
-    
-    # 8. Sign with seller's private key
-    # seller_key = CBitcoinSecret(seller_privkey)
-    sig = seller_key.sign(sighash) + bytes([SIGHASH_ALL])
-    
-    # 9. Create the proper scriptSig that reveals K and takes the IF branch
-    # The scriptSig structure for the IF branch is:
-    # <signature> <K> <TRUE> <redeemScript>
-    script_sig = CScript([
-        sig,           # Seller's signature
-        args.real_k.encode(),        # Reveal K (the decryption key)
-        1,             # TRUE to take the IF branch
-        redeem_script  # The complete redeem script
-    ])
-    
-    # 10. Set the scriptSig in the transaction
-    tx.vin[0].scriptSig = script_sig
-    
-    # 11. Convert transaction to hex
+    # 4. Create the signed, replaceable transaction
+    tx = build_claim_at_rate(redeem_script, args.txid, args.vout, amount, real_k,
+                             seller_key, script_pub_key, fee_rate)
     tx_hex = b2x(tx.serialize())
     print(f"[*] Complete transaction hex: {tx_hex}")
-    
-    # 12. Broadcast the transaction
+
+    # 5. Verify the scriptSig locally so a malformed spend never reaches the node
+    try:
+        verify_spend(tx, redeem_script)
+    except Exception as e:
+        print(f"[!] Local script verification failed: {e}")
+        sys.exit(1)
+    print("[*] scriptSig verified locally")
+
+    # 6. Broadcast the transaction
     try:
         print("[*] Broadcasting transaction...")
-        result = run_command(f"bitcoin-cli -regtest sendrawtransaction {tx_hex}")
+        result = run_command(f"{BITCOIN_CLI} sendrawtransaction {tx_hex}")
         txid = result["result"] if "result" in result else result["error"]
         print(f"[*] Transaction broadcast result: {txid}")
-        
-        # 13. Mine some blocks to confirm
-        print("[*] Mining blocks to confirm transaction...")
-        run_command(f"bitcoin-cli -regtest generatetoaddress 6 {seller_address}")
+        broadcast_time = time.time()
+        broadcast_height = height
+        bumps = 0
+
+        if args.watch:
+            # 7. Re-sign with a higher fee until confirmed, tightening the target towards the locktime
+            print(f"[*] Waiting for confirmation, bumping after {args.conf_target} blocks...")
+            last_bump_height = height
+            # Every version we broadcast, since any of them may be the one that confirms
+            sent = {txid: (tx, fee_rate)}
+            while True:
+                height = run_command(f"{BITCOIN_CLI} waitfornewblock")["height"]
+                confirmed = [t for t in sent if get_confirmations(t, seller_wallet) > 0]
+                if confirmed:
+                    tx, fee_rate = sent[confirmed[0]]
+                    break
+                if height - last_bump_height < conf_target:
+                    continue
+                conf_target = max(min(args.conf_target, args.locktime - height), 1)
+                bumped_rate = bump_fee_rate(fee_rate, conf_target)
+                bumped = build_claim_at_rate(redeem_script, args.txid, args.vout, amount, real_k,
+                                             seller_key, script_pub_key, bumped_rate)
+                verify_spend(bumped, redeem_script)
+                last_bump_height = height
+                try:
+                    txid = rpc(f"{BITCOIN_CLI} sendrawtransaction {b2x(bumped.serialize())}")["result"]
+                except RPCError as e:
+                    # Blocks only, since our own claim spends the output in the mempool
+                    spent = not run_command(f"{BITCOIN_CLI} gettxout {args.txid} {args.vout} false").get("value")
+                    # e.g. the claim confirmed between the check above and the broadcast
+                    confirmed = [t for t in sent if get_confirmations(t, seller_wallet) > 0]
+                    if confirmed:
+                        tx, fee_rate = sent[confirmed[0]]
+                        break
+                    if spent:
+                        print(f"[!] Claim lost: {args.txid}:{args.vout} was spent by another transaction, such as the buyer's refund")
+                        sys.exit(1)
+                    print(f"[!] Replacement rejected, keeping {txid}: {e}")
+                    continue
+                tx, fee_rate = bumped, bumped_rate
+                sent[txid] = (tx, fee_rate)
+                bumps += 1
+                print(f"[*] Bumped fee to {fee_rate:.2f} sat/vB: {txid}")
+        else:
+            # 7. Mine some blocks to confirm
+            print("[*] Mining blocks to confirm transaction...")
+            run_command(f"{BITCOIN_CLI} generatetoaddress 6 {seller_address}")
         print("[*] Transaction confirmed!")
-        
-        # 14. Extract K from transaction for buyer
+
+        confirm_height = run_command(f"{BITCOIN_CLI} getblockchaininfo")["blocks"]
+        print("[*] Time to confirm: " + json.dumps({
+            "txid": b2lx(tx.GetTxid()),
+            "fee": amount - tx.vout[0].nValue,
+            "fee_rate": fee_rate,
+            "bumps": bumps,
+            "blocks": confirm_height - broadcast_height,
+            "seconds": round(time.time() - broadcast_time, 3),
+        }))
+
+        if args.registry:
+            registry = ContractRegistry(args.registry)
+            registry.mark_spent(script_hash(redeem_script), STATE_CLAIMED, tx.GetTxid()[::-1])
+            registry.close()
+            print(f"[*] Contract marked as claimed in {args.registry}")
+
+        # 8. Extract K from transaction for buyer
         print("\n[*] ZKCP Completed!")
-        print(f"[*] Seller revealed K: {args.real_k.decode()}")
+        print(f"[*] Seller revealed K: {args.real_k}")
         print("[*] Buyer can now use K to decrypt the purchased content")
         
     except Exception as e:
         print(f"[!] Error broadcasting transaction: {e}")
-        print("[!] This could be due to incorrect scriptSig construction")
+        print("[!] The scriptSig passed local verification, check the funding outpoint and fee")
         
     print("\n[*] ZKCP Simulation Complete")
 
 if __name__ == "__main__":
-    main()
-
-
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+    from profiling import profiled
+    profiled(main)
\ No newline at end of file
@@ -4,6 +4,7 @@ ZKCP Transaction Builder - Uses Bitcoin Core's built-in functions to create and
 """
 
 import argparse
+import os
 import sys
 import json
 import subprocess
@@ -146,6 +147,8 @@ echo "[*] Manual construction completed successfully"
     print("\n[*] ZKCP Simulation Complete")
 
 if __name__ == "__main__":
-    main()
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+    from profiling import profiled
+    profiled(main)
 
 